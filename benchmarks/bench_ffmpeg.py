@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import media
+from utils.ffmpeg_helper import FFmpegHelper
+
+# operation -> (inputs needed, output extension, coroutine factory)
+OPERATIONS = {
+    "merge_subtitle": (
+        ("video", "subtitle"), "mp4",
+        lambda ff, i, out: ff.merge_subtitle(i["video"], i["subtitle"], out)
+    ),
+    "merge_audio": (
+        ("video", "audio"), "mp4",
+        lambda ff, i, out: ff.merge_audio(i["video"], i["audio"], out)
+    ),
+    "add_audio_track": (
+        ("video", "audio"), "mkv",
+        lambda ff, i, out: ff.add_audio_track(i["video"], i["audio"], out)
+    ),
+    "extract_audio": (
+        ("video",), "mp3",
+        lambda ff, i, out: ff.extract_audio(i["video"], out)
+    ),
+    "remove_audio": (
+        ("video",), "mp4",
+        lambda ff, i, out: ff.remove_audio(i["video"], out)
+    ),
+}
+
+METRICS = ("wall_time", "cpu_time", "peak_rss_kb", "bytes_written")
+
+
+def run_case(operation: str, inputs: dict, output_path: str) -> dict:
+    """Run one operation; executed in a fresh process so child rusage is its own"""
+    _, _, factory = OPERATIONS[operation]
+    helper = FFmpegHelper()
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+
+    success = asyncio.run(factory(helper, inputs, output_path))
+
+    wall_time = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_time = (
+        (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        + (self_after.ru_utime - self_before.ru_utime) + (self_after.ru_stime - self_before.ru_stime)
+    )
+    bytes_written = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    return {
+        "success": bool(success),
+        "wall_time": round(wall_time, 4),
+        "cpu_time": round(cpu_time, 4),
+        # ru_maxrss of children is the largest ffmpeg process, in KB on Linux
+        "peak_rss_kb": after.ru_maxrss,
+        "bytes_written": bytes_written,
+    }
+
+
+def prepare_inputs(ffmpeg: str, workdir: str, size: str, container: str) -> dict:
+    return {
+        "video": media.make_video(ffmpeg, workdir, size, container),
+        "audio": media.make_audio(ffmpeg, workdir, size),
+        "subtitle": media.make_subtitle(workdir, size),
+    }
+
+
+def ffmpeg_version(ffmpeg: str) -> str:
+    try:
+        out = subprocess.run([ffmpeg, '-version'], capture_output=True, text=True).stdout
+        return out.splitlines()[0] if out else "unknown"
+    except OSError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark FFmpegHelper operations on synthetic media (no Telegram needed)"
+    )
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated, from {','.join(media.SIZES)}")
+    parser.add_argument("--containers", default=",".join(media.CONTAINERS), help="comma separated input containers")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="comma separated operations")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--workdir", help="where synthetic media is generated and kept between runs")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    args = parser.parse_args()
+
+    ffmpeg = FFmpegHelper().ffmpeg
+    if not shutil.which(ffmpeg):
+        sys.exit(f"ffmpeg not found: {ffmpeg}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_media_")
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    # max_tasks_per_child=1 gives every run a clean RUSAGE_CHILDREN
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        for size in args.sizes.split(","):
+            for container in args.containers.split(","):
+                inputs = prepare_inputs(ffmpeg, workdir, size, container)
+                input_bytes = os.path.getsize(inputs["video"])
+
+                for operation in args.ops.split(","):
+                    needed, extension, _ = OPERATIONS[operation]
+                    case_inputs = {name: inputs[name] for name in needed}
+                    output_path = os.path.join(workdir, f"out_{operation}_{size}_{container}.{extension}")
+
+                    runs = [
+                        pool.submit(run_case, operation, case_inputs, output_path).result()
+                        for _ in range(args.repeat)
+                    ]
+                    median = {
+                        metric: statistics.median(run[metric] for run in runs)
+                        for metric in METRICS
+                    }
+                    case = f"{operation}/{size}/{container}"
+                    results.append({
+                        "case": case,
+                        "operation": operation,
+                        "size": size,
+                        "container": container,
+                        "input_bytes": input_bytes,
+                        "success": all(run["success"] for run in runs),
+                        "median": median,
+                        "runs": runs,
+                    })
+                    print(
+                        f"{case:40} wall {median['wall_time']:8.3f}s  cpu {median['cpu_time']:8.3f}s  "
+                        f"rss {median['peak_rss_kb'] / 1024:7.1f}MB  out {median['bytes_written'] / 1048576:8.1f}MB"
+                    )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": ffmpeg_version(ffmpeg),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return {result["case"]: result for result in json.load(f)["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown treated as a regression")
+    parser.add_argument("--metrics", default="wall_time,cpu_time", help="metrics that can fail the comparison")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    gated = set(args.metrics.split(","))
+    regressions = []
+    failed = []
+
+    for case in sorted(baseline.keys() & candidate.keys()):
+        # A run that failed early looks like a huge speedup; report it instead of timing it
+        failed_in = [name for name, results in (("baseline", baseline), ("candidate", candidate))
+                     if not results[case].get("success", True)]
+        if failed_in:
+            print(f"{case:40} failed in {' and '.join(failed_in)}")
+            failed.append(f"{case} failed in {' and '.join(failed_in)}")
+            continue
+        old, new = baseline[case]["median"], candidate[case]["median"]
+        cells = []
+        for metric in old:
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            cells.append(f"{metric} {change:+7.1%}")
+            if metric in gated and change > args.threshold:
+                regressions.append(f"{case} {metric}: {old[metric]} -> {new[metric]} ({change:+.1%})")
+        print(f"{case:40} " + "  ".join(cells))
+
+    for case in sorted(baseline.keys() ^ candidate.keys()):
+        result = baseline.get(case) or candidate[case]
+        name = "baseline" if case in baseline else "candidate"
+        print(f"{case:40} only in {name}")
+        if not result.get("success", True):
+            failed.append(f"{case} failed in {name}")
+
+    if regressions:
+        print("\nRegressions:")
+        print("\n".join(regressions))
+    if failed:
+        print("\nFailed runs:")
+        print("\n".join(failed))
+    if regressions or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram.errors import FloodWait
+from benchmarks import media
+from utils.loop_monitor import LoopMonitor
+
+# scenario -> (callback data, media kinds sent in order)
+SCENARIOS = {
+    "merge_audio": ("merge_audio", ("video", "audio")),
+    "add_audio": ("add_audio", ("video", "audio")),
+    "extract_audio": ("extract_audio", ("video",)),
+    "remove_audio": ("remove_audio", ("video",)),
+    "merge_sub": ("merge_sub", ("video", "subtitle")),
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class FakeMessage:
+    """Just enough of pyrogram's Message for the bot's handlers"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client, chat_id, text=None, user=None, **media_kinds):
+        self._client = client
+        self.id = next(self._ids)
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = user
+        self.text = text
+        self.caption = None
+        self.command = text.split() if text and text.startswith("/") else None
+        self.video = media_kinds.get("video")
+        self.document = media_kinds.get("document")
+        self.audio = media_kinds.get("audio")
+
+    async def reply_text(self, text, **kwargs):
+        return await self._client.send_message(self.chat.id, text, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        await self._client._api_call("edit_message_text")
+        self.text = text
+        return self
+
+    async def edit_reply_markup(self, reply_markup=None):
+        await self._client._api_call("edit_message_reply_markup")
+        return self
+
+    async def delete(self):
+        await self._client._api_call("delete_messages")
+
+
+class FakeClient:
+    """Local stand-in for pyrogram.Client: files come from disk, uploads go to a sink"""
+
+    def __init__(self, latency=0.05, jitter=0.02, bandwidth=20 * CHUNK_SIZE,
+                 flood_rate=0.0, flood_wait=5, sleep_threshold=10, download_dir="downloads"):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.sleep_threshold = sleep_threshold
+        self.download_dir = download_dir
+
+        self.files = {}
+        self.calls = {}
+        self.flood_waits = 0
+        self.flood_errors = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+    # Handler registration is a no-op; the harness calls handlers directly
+    def on_message(self, *args, **kwargs):
+        return lambda func: func
+
+    def on_callback_query(self, *args, **kwargs):
+        return lambda func: func
+
+    def add_file(self, path):
+        """Register a local file as Telegram media and return its file_id"""
+        file_id = f"fake_{len(self.files)}_{os.path.basename(path)}"
+        self.files[file_id] = path
+        return file_id
+
+    async def _api_call(self, method):
+        """Simulate RPC latency and FloodWait the way pyrogram surfaces it"""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.flood_waits += 1
+            # pyrogram sleeps through waits under sleep_threshold by itself
+            if self.flood_wait <= self.sleep_threshold:
+                await asyncio.sleep(self.flood_wait)
+            else:
+                self.flood_errors += 1
+                raise FloodWait(value=self.flood_wait)
+
+    async def _transfer(self, size, progress, progress_args):
+        done = 0
+        while done < size:
+            chunk = min(CHUNK_SIZE, size - done)
+            await asyncio.sleep(chunk / self.bandwidth)
+            done += chunk
+            if progress:
+                result = progress(done, size, *progress_args)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    async def download_media(self, message, file_name="downloads/", in_memory=False,
+                             block=True, progress=None, progress_args=()):
+        await self._api_call("download_media")
+        media_obj = message.video or message.document or message.audio
+        source = self.files[media_obj.file_id]
+
+        if file_name.endswith("/") or os.path.isdir(file_name):
+            file_name = os.path.join(file_name, media_obj.file_name or os.path.basename(source))
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+
+        await self._transfer(media_obj.file_size, progress, progress_args)
+        await asyncio.to_thread(shutil.copyfile, source, file_name)
+        self.bytes_downloaded += media_obj.file_size
+        return file_name
+
+    async def _upload(self, method, chat_id, path, caption, progress, progress_args, **kwargs):
+        await self._api_call(method)
+        size = await asyncio.to_thread(os.path.getsize, path)
+        await self._transfer(size, progress, progress_args)
+        self.bytes_uploaded += size
+        return FakeMessage(self, chat_id, text=caption)
+
+    async def send_video(self, chat_id, video, caption="", progress=None, progress_args=(), **kwargs):
+        return await self._upload("send_video", chat_id, video, caption, progress, progress_args)
+
+    async def send_audio(self, chat_id, audio, caption="", progress=None, progress_args=(), **kwargs):
+        return await self._upload("send_audio", chat_id, audio, caption, progress, progress_args)
+
+    async def send_document(self, chat_id, document, caption="", progress=None, progress_args=(), **kwargs):
+        return await self._upload("send_document", chat_id, document, caption, progress, progress_args)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._api_call("send_message")
+        return FakeMessage(self, chat_id, text=text)
+
+
+class FakeDatabase:
+    """In-memory replacement for database.Database"""
+
+    def __init__(self):
+        self.users = {}
+        self.broadcasts = []
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def add_user(self, user_id, first_name):
+        self.users.setdefault(user_id, {"user_id": user_id, "first_name": first_name})
+
+    async def get_user_stats(self, user_id):
+        return self.users.get(user_id, {})
+
+    async def increment_stat(self, user_id, stat):
+        user = self.users.setdefault(user_id, {"user_id": user_id})
+        user[stat] = user.get(stat, 0) + 1
+
+    async def update_size_processed(self, user_id, size):
+        user = self.users.setdefault(user_id, {"user_id": user_id})
+        user["size_processed"] = user.get("size_processed", 0) + size
+
+    async def get_all_users(self):
+        return list(self.users.values())
+
+    async def save_broadcast(self, text, success, failed):
+        self.broadcasts.append((text, success, failed))
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float, samples: list):
+    """Sample how late the loop wakes up; large values mean something blocked it"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_user(bot_module, client, user_id, scenario, inputs, results):
+    callback_data, sends = SCENARIOS[scenario]
+    user = SimpleNamespace(id=user_id, first_name=f"User{user_id}", mention=f"User{user_id}")
+
+    start = time.perf_counter()
+    error = None
+    try:
+        query_message = FakeMessage(client, user_id, text="menu", user=user)
+        callback = SimpleNamespace(
+            data=callback_data,
+            from_user=user,
+            message=query_message,
+            answer=lambda *args, **kwargs: client._api_call("answer_callback_query"),
+        )
+        await bot_module.callback_handler(client, callback)
+
+        for kind in sends:
+            path = inputs[kind]
+            media_obj = SimpleNamespace(
+                file_id=client.add_file(path),
+                file_unique_id=f"{kind}_{os.path.basename(path)}",
+                file_size=os.path.getsize(path),
+                file_name=f"{user_id}_{os.path.basename(path)}",
+                mime_type=None,
+            )
+            attrs = {"video": media_obj} if kind == "video" else {"document": media_obj}
+            message = FakeMessage(client, user_id, user=user, **attrs)
+            await bot_module.document_handler(client, message)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    results.append({
+        "user_id": user_id,
+        "scenario": scenario,
+        "latency": time.perf_counter() - start,
+        "error": error,
+    })
+
+
+async def run(args):
+    import bot as bot_module
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="load_media_")
+    os.makedirs(workdir, exist_ok=True)
+    ffmpeg = shutil.which(args.ffmpeg) or args.ffmpeg
+    inputs = {
+        "video": args.video or media.make_video(ffmpeg, workdir, args.size, "mp4"),
+        "audio": args.audio or media.make_audio(ffmpeg, workdir, args.size),
+        "subtitle": args.subtitle or media.make_subtitle(workdir, args.size),
+    }
+
+    client = FakeClient(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        bandwidth=args.bandwidth * CHUNK_SIZE,
+        flood_rate=args.flood_rate,
+        flood_wait=args.flood_wait,
+    )
+    bot_module.bot = bot_module.MediaBot(app=client, db=FakeDatabase())
+
+    monitor = LoopMonitor(args.block_threshold / 1000, 0.01)
+    monitor.start()
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, monitor.interval, lag_samples))
+
+    scenarios = args.scenarios.split(",")
+    results = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id):
+        # Stagger arrivals so the run looks like traffic rather than a single burst
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        async with semaphore:
+            await run_user(bot_module, client, user_id, scenarios[user_id % len(scenarios)], inputs, results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(1000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await lag_task
+    monitor.stop()
+
+    latencies = [r["latency"] for r in results if not r["error"]]
+
+    report = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "elapsed": round(elapsed, 3),
+        "throughput_jobs_per_sec": round(len(latencies) / elapsed, 3) if elapsed else 0,
+        "bytes_downloaded": client.bytes_downloaded,
+        "bytes_uploaded": client.bytes_uploaded,
+        "errors": [r for r in results if r["error"]],
+        "latency": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3) if latencies else 0,
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0,
+        },
+        "api_calls": client.calls,
+        "flood_waits": client.flood_waits,
+        "flood_errors": client.flood_errors,
+        "loop_lag": {
+            "p99_ms": round(percentile(lag_samples, 99) * 1000, 2),
+            "max_ms": round(max(lag_samples, default=0) * 1000, 2),
+        },
+        "event_loop_stalls": sorted(
+            ({"where": where, **stall} for where, stall in monitor.stalls.items()),
+            key=lambda entry: entry["count"],
+            reverse=True
+        ),
+    }
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay concurrent users through the bot's handlers against a fake Telegram client"
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20, help="users active at the same time")
+    parser.add_argument("--ramp", type=float, default=2.0, help="spread user arrivals over this many seconds")
+    parser.add_argument("--scenarios", default="extract_audio,remove_audio,merge_audio")
+    parser.add_argument("--size", default="small", choices=list(media.SIZES))
+    parser.add_argument("--video", help="use this video instead of generating one")
+    parser.add_argument("--audio", help="use this audio instead of generating one")
+    parser.add_argument("--subtitle", help="use this subtitle instead of generating one")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg used to generate synthetic media")
+    parser.add_argument("--workdir")
+    parser.add_argument("--latency", type=float, default=50, help="mean RPC latency in ms")
+    parser.add_argument("--jitter", type=float, default=20, help="RPC latency jitter in ms")
+    parser.add_argument("--bandwidth", type=float, default=20, help="per-transfer bandwidth in MB/s")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probability that an RPC hits FloodWait")
+    parser.add_argument("--flood-wait", type=int, default=5, help="FloodWait duration in seconds")
+    parser.add_argument("--block-threshold", type=float, default=100, help="report loop blocks longer than this, in ms")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
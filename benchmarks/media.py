@@ -0,0 +1,65 @@
+import os
+import subprocess
+
+# name -> (duration in seconds, resolution)
+SIZES = {
+    "small": (10, "640x360"),
+    "medium": (60, "1280x720"),
+    "large": (180, "1920x1080"),
+}
+
+CONTAINERS = ("mp4", "mkv")
+
+
+def _run(cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def make_video(ffmpeg: str, workdir: str, size: str, container: str) -> str:
+    """Video with a test pattern and a stereo sine track"""
+    duration, resolution = SIZES[size]
+    path = os.path.join(workdir, f"video_{size}.{container}")
+    if os.path.exists(path):
+        return path
+
+    _run([
+        ffmpeg, '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={resolution}:rate=25',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-ac', '2',
+        '-y', path
+    ])
+    return path
+
+
+def make_audio(ffmpeg: str, workdir: str, size: str) -> str:
+    """MP3 audio track matching the video duration"""
+    duration, _ = SIZES[size]
+    path = os.path.join(workdir, f"audio_{size}.mp3")
+    if os.path.exists(path):
+        return path
+
+    _run([
+        ffmpeg, '-v', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=880:sample_rate=44100:duration={duration}',
+        '-c:a', 'libmp3lame', '-q:a', '4',
+        '-y', path
+    ])
+    return path
+
+
+def make_subtitle(workdir: str, size: str) -> str:
+    """SRT file with one cue every two seconds"""
+    duration, _ = SIZES[size]
+    path = os.path.join(workdir, f"subtitle_{size}.srt")
+    if os.path.exists(path):
+        return path
+
+    def timestamp(ms):
+        return f"{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02},{ms % 1000:03}"
+
+    with open(path, "w", encoding="utf-8") as f:
+        for i, start in enumerate(range(0, duration * 1000, 2000), 1):
+            f.write(f"{i}\n{timestamp(start)} --> {timestamp(start + 1500)}\nBenchmark cue {i}\n\n")
+    return path
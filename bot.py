@@ -1,16 +1,27 @@
 import os
 import asyncio
+import signal
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
+import atexit
+import queue
 import logging
+import logging.handlers
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: records are queued and written by a background thread,
+# so a slow disk or terminal never blocks the event loop
+log_queue = queue.SimpleQueue()
+log_output = logging.StreamHandler()
+log_output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_output)
+log_input = logging.handlers.QueueHandler(log_queue)
+# Only merge the message arguments here; log_output adds time, logger and level
+log_input.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[log_input])
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Import handlers
@@ -19,22 +30,60 @@ from handlers.audio_handler import AudioHandler
 from handlers.subtitle_handler import SubtitleHandler
 from handlers.admin_handler import AdminHandler
 from handlers.broadcast_handler import BroadcastHandler
+from handlers.track_handler import TrackHandler
+from utils.job_scheduler import job_scheduler
+from utils.quota_manager import QuotaManager
+from utils.job_registry import job_registry
+from utils.input_cache import input_cache
+from utils.watchdog import watchdog
+from utils.metrics import metrics
+from utils.ban_cache import BanCache
+from utils.job_history import JobHistory
+from utils.pending_jobs import PendingJobs
+from utils.loop_monitor import loop_monitor
 from database.database import Database
+from database.indexes import DatabaseSetup
 from config import Config
 
 class MediaBot:
-    def __init__(self):
-        self.app = Client(
+    def __init__(self, app=None, db=None):
+        # app and db can be swapped for fakes, e.g. by the load harness
+        self.app = app or Client(
             "media_bot",
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
             bot_token=Config.BOT_TOKEN,
-            workers=50,
-            sleep_threshold=10
+            workers=getattr(Config, "WORKERS", 50),
+            sleep_threshold=getattr(Config, "SLEEP_THRESHOLD", 10),
+            max_concurrent_transmissions=getattr(Config, "MAX_CONCURRENT_TRANSMISSIONS", 4)
         )
         
         # Initialize database
-        self.db = Database()
+        self.db = db or Database()
+        
+        # User sessions for multi-file operations, shared with the handlers
+        # which clear them through app.user_sessions when a job finishes
+        self.user_sessions = {}
+        self.app.user_sessions = self.user_sessions
+        
+        # Per-user limits, checked before any download starts
+        self.quota = QuotaManager(self.db)
+        
+        # Banned users, checked in memory on every update
+        self.bans = BanCache(self.db)
+        
+        # Every finished job is recorded for /analytics
+        self.history = JobHistory(self.db)
+        job_registry.listeners.append(self.history.record)
+        
+        # Work handed over between processes on a graceful restart
+        self.pending = PendingJobs(self.db)
+        self.draining = False
+        self.drain_task = None
+        # Cleared by start() while saved work is queued again, so it goes ahead of new files
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.stopped = asyncio.Event()
         
         # Initialize handlers
         self.video_handler = VideoHandler(self.app, self.db)
@@ -42,16 +91,26 @@ class MediaBot:
         self.subtitle_handler = SubtitleHandler(self.app, self.db)
         self.admin_handler = AdminHandler(self.app, self.db)
         self.broadcast_handler = BroadcastHandler(self.app, self.db)
-        
-        # User sessions for multi-file operations
-        self.user_sessions = {}
+        self.track_handler = TrackHandler(self.app, self.db)
         
     async def start(self):
         """Start the bot"""
         await self.db.connect()
+        await DatabaseSetup().ensure(getattr(self.db, "db", None))
+        await self.bans.start()
+        self.resumed.clear()
+        saved = await self.pending.take()
         await self.app.start()
+        watchdog.start()
+        loop_monitor.start()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.begin_drain)
         logger.info("Bot started successfully!")
         
+        try:
+            await self.resume(saved)
+        finally:
+            self.resumed.set()
+        
         # Send startup message to log channel
         try:
             await self.app.send_message(
@@ -62,17 +121,164 @@ class MediaBot:
         except Exception as e:
             logger.error(f"Failed to send startup message: {e}")
         
-        await asyncio.Event().wait()
+        await self.stopped.wait()
+    
+    async def resume(self, entries: list):
+        """Restore sessions and requeue jobs saved by the previous process, in their original order"""
+        resumed = 0
+        for entry in entries:
+            user_id = entry["user_id"]
+            try:
+                session = await PendingJobs.restore(self.app, entry["session"])
+                if entry["kind"] == "document":
+                    message = await self.app.get_messages(entry["chat_id"], entry["message_id"])
+                    if message is None or message.empty:
+                        raise ValueError("the file message is gone")
+                elif entry["kind"] == "edit_tracks":
+                    user = await self.app.get_users(user_id)
+                # The video of a multi-step session survives in the input cache
+                if session.get("video_path") and not input_cache.hold(session["video_path"]):
+                    raise ValueError("the video is no longer cached")
+            except Exception as e:
+                logger.error(f"Could not resume work of user {user_id}: {e}")
+                try:
+                    await self.app.send_message(
+                        user_id,
+                        "⚠️ The bot restarted and your operation could not be restored.\n"
+                        "Please start again with /start."
+                    )
+                except:
+                    pass
+                continue
+            
+            self.user_sessions[user_id] = session
+            if entry["kind"] == "document":
+                asyncio.create_task(run_document(message, session, charge=False))
+            elif entry["kind"] == "edit_tracks":
+                asyncio.create_task(self.track_handler.apply(user, session))
+            resumed += 1
+        
+        if entries:
+            logger.info(f"Resumed {resumed} of {len(entries)} pending jobs and sessions")
+    
+    def begin_drain(self):
+        """Drain in the background and stop (SIGTERM or /drain)"""
+        if self.draining:
+            return
+        self.draining = True
+        self.drain_task = asyncio.create_task(self.shutdown())
+    
+    async def shutdown(self):
+        try:
+            await self.drain()
+        except Exception as e:
+            logger.error(f"Drain failed: {e}")
+        finally:
+            await self.stop()
+            self.stopped.set()
+    
+    async def drain(self):
+        """Let running jobs finish up to DRAIN_TIMEOUT and save everything else for the next start"""
+        timeout = getattr(Config, "DRAIN_TIMEOUT", 300)
+        entries = []
+        deferred = []
+        
+        def defer(job):
+            entries.append(dict(job.info["resume"], user_id=job.user_id))
+            deferred.append(job)
+            job_registry.cancel_job(job, RESTART_TEXT, "deferred")
+        
+        # Queued jobs have not done anything yet: hand them over right away
+        for job in job_registry.all_jobs():
+            if job.started is None and job.info.get("resume"):
+                defer(job)
+        
+        running = [job for job in job_registry.all_jobs() if not job.cancelled]
+        logger.info(f"Draining: {len(entries)} queued jobs saved, waiting up to {timeout}s for {len(running)} running")
+        if running:
+            await asyncio.wait([job.task for job in running], timeout=timeout)
+        
+        # Past the deadline: start over in the next process, from the cached input
+        for job in job_registry.all_jobs():
+            if job.cancelled:
+                continue
+            if job.info.get("resume"):
+                defer(job)
+            else:
+                job_registry.cancel_job(job, "❌ Stopped: the bot is restarting.\nPlease try again in a minute.")
+                deferred.append(job)
+        await asyncio.gather(*(job.task for job in deferred), return_exceptions=True)
+        
+        for job in deferred:
+            if not job.status_msgs:
+                try:
+                    await self.app.send_message(job.user_id, RESTART_TEXT)
+                except:
+                    pass
+        
+        # Sessions between steps, e.g. waiting for the audio of a merge
+        saved_users = {entry["user_id"] for entry in entries}
+        for user_id, session in self.user_sessions.items():
+            if user_id not in saved_users:
+                entries.append({"user_id": user_id, "kind": "session", "session": PendingJobs.snapshot(session)})
+        
+        await self.pending.save(entries)
+        
+    async def cancel(self, user_id: int):
+        """Cancel a user's running jobs and session; returns False if there was nothing to cancel"""
+        cancelled = await job_registry.cancel(user_id)
+        session = self.user_sessions.pop(user_id, None)
+        if session:
+            # The video a multi-step session kept between its messages
+            input_cache.release(session.get("video_path"))
+        return bool(cancelled or session)
+        
+    def new_session(self, user_id: int, session: dict):
+        """Start a menu session, giving back the video a replaced one still kept"""
+        old = self.user_sessions.get(user_id)
+        # A running job owns its session and gives the video back itself
+        if old and not job_registry.has_jobs(user_id):
+            input_cache.release(old.get("video_path"))
+        self.user_sessions[user_id] = session
         
     async def stop(self):
         """Stop the bot"""
+        loop_monitor.stop()
         await self.app.stop()
+        await self.quota.sync()
+        await self.history.flush()
         await self.db.close()
         logger.info("Bot stopped!")
 
+# Shown on jobs handed over to the next process
+RESTART_TEXT = (
+    "🔄 The bot is restarting for an update.\n"
+    "Your job is saved and continues automatically in a minute."
+)
+
 # Initialize bot
 bot = MediaBot()
 
+# ============ BAN GATE ============
+# Runs before every other handler, admin commands included, from the in-memory ban list
+@bot.app.on_message(group=-2)
+async def ban_gate(client, message: Message):
+    if message.from_user and bot.bans.is_banned(message.from_user.id):
+        await message.reply_text("🚫 You are banned from using this bot.")
+        message.stop_propagation()
+
+@bot.app.on_callback_query(group=-2)
+async def ban_gate_callback(client, callback_query):
+    if bot.bans.is_banned(callback_query.from_user.id):
+        await callback_query.answer("🚫 You are banned from using this bot.", show_alert=True)
+        callback_query.stop_propagation()
+
+# After the admin handler applied a ban or unban, so it takes effect without
+# waiting for the change stream or the next poll
+@bot.app.on_message(filters.command(["ban", "unban"]) & filters.user(Config.ADMIN_IDS), group=1)
+async def ban_changed(client, message: Message):
+    await bot.bans.reload()
+
 # ============ START COMMAND ============
 @bot.app.on_message(filters.command("start") & filters.private)
 async def start_command(client, message: Message):
@@ -103,7 +309,11 @@ async def start_command(client, message: Message):
             InlineKeyboardButton("🔇 Remove Audio", callback_data="remove_audio")
         ],
         [
-            InlineKeyboardButton("📤 Extract Audio", callback_data="extract_audio")
+            InlineKeyboardButton("📤 Extract Audio", callback_data="extract_audio"),
+            InlineKeyboardButton("➕ Add Audio Track", callback_data="add_audio")
+        ],
+        [
+            InlineKeyboardButton("🎚 Edit Tracks", callback_data="edit_tracks")
         ],
         [
             InlineKeyboardButton("ℹ️ Help", callback_data="help"),
@@ -118,8 +328,10 @@ async def start_command(client, message: Message):
         "✅ Merge subtitles to video (SRT, ASS, VTT)\n"
         "✅ Extract subtitles from video\n"
         "✅ Merge audio to video\n"
+        "✅ Add extra audio tracks without re-encoding\n"
         "✅ Extract audio from video\n"
         "✅ Remove audio from video\n"
+        "✅ Drop, reorder and retag audio/subtitle tracks in one pass\n"
         "✅ Support files up to 4GB\n"
         "✅ Batch processing support\n\n"
         "🚀 **Choose an option below to get started!**",
@@ -148,11 +360,20 @@ async def help_command(client, message: Message):
 1. Click "Merge Audio" button
 2. Send your video file
 3. Send your audio file
+   (add `norm` as a caption to normalize its loudness)
 4. Bot will merge and send back
 
+**Add Audio Track to Video:**
+1. Click "Add Audio Track" button
+2. Send your video file
+3. Send your audio file, optionally with a caption like `+1.5 hin`
+   (delay in seconds and language code)
+4. Bot keeps the original audio and adds the new track
+
 **Extract Audio from Video:**
 1. Click "Extract Audio" button
 2. Send your video file
+   (add `norm` as a caption to normalize loudness)
 3. Choose audio format (MP3/AAC/etc)
 4. Bot will extract and send
 
@@ -161,6 +382,13 @@ async def help_command(client, message: Message):
 2. Send your video file
 3. Bot will remove audio and send back
 
+**Edit Tracks:**
+1. Click "Edit Tracks" button
+2. Send your video file
+3. Use the buttons to keep/drop tracks, set the default,
+   reorder and change language tags
+4. Press Apply - the video is remuxed once without re-encoding
+
 **Batch Processing:**
 - Send multiple files for batch processing
 - Use /cancel to stop current operation
@@ -207,12 +435,73 @@ async def stats_command(client, message: Message):
     
     await message.reply_text(stats_text)
 
+# ============ METRICS COMMAND ============
+@bot.app.on_message(filters.command("metrics") & filters.user(Config.ADMIN_IDS), group=-1)
+async def metrics_command(client, message: Message):
+    counters = "\n".join(f"• {name}: {value}" for name, value in metrics.snapshot().items())
+    await message.reply_text(
+        "📈 **Bot Metrics**\n\n"
+        f"{counters}\n\n"
+        f"⚙️ Jobs running: {job_scheduler.running} / {job_scheduler.slots}\n"
+        f"⏳ Jobs queued: {len(job_scheduler.queue)}"
+    )
+
+# ============ DRAIN COMMAND ============
+@bot.app.on_message(filters.command("drain") & filters.user(Config.ADMIN_IDS), group=-1)
+async def drain_command(client, message: Message):
+    if bot.draining:
+        await message.reply_text("⏳ Already draining.")
+        return
+    
+    await message.reply_text(
+        "🔄 **Draining**\n\n"
+        "No new jobs are accepted. Running jobs get up to "
+        f"{getattr(Config, 'DRAIN_TIMEOUT', 300)}s to finish, queued jobs and open sessions "
+        "are saved for the next start, then the bot stops."
+    )
+    bot.begin_drain()
+
+# ============ ANALYTICS COMMAND ============
+@bot.app.on_message(filters.command("analytics") & filters.user(Config.ADMIN_IDS), group=-1)
+async def analytics_command(client, message: Message):
+    days = int(message.command[1]) if len(message.command) > 1 and message.command[1].isdigit() else 7
+    
+    if bot.history.collection is None:
+        await message.reply_text("❌ Job history needs MongoDB.")
+        return
+    
+    status_msg = await message.reply_text("📊 Crunching job history...")
+    try:
+        report = await bot.history.analytics(days)
+    except Exception as e:
+        logger.error(f"Analytics error: {e}")
+        await status_msg.edit_text(f"❌ Analytics failed: {str(e)}")
+        return
+    
+    size = bot.audio_handler.file_helper.format_size
+    lines = [f"📊 **Job Analytics – last {days} days**\n"]
+    for op in report["operations"]:
+        name = op["_id"]["operation"] + (f" (step {op['_id']['step']})" if op["_id"].get("step", 1) > 1 else "")
+        p50, p95 = op.get("percentiles") or (None, None)
+        lines.append(
+            f"**{name}**: {op['jobs']} jobs, {op['ok']} ok\n"
+            f"   ⏱ p50 {p50 or 0:.0f}s • p95 {p95 or 0:.0f}s • avg {op.get('avg_duration') or 0:.0f}s\n"
+            f"   📥 {size(op['input_bytes'])} in • 📤 {size(op['output_bytes'])} out\n"
+            f"   ⏳ queue {op.get('queue') or 0:.0f}s • ⏬ {op.get('download') or 0:.0f}s • "
+            f"⚙️ {op.get('process') or 0:.0f}s • ⏫ {op.get('upload') or 0:.0f}s"
+        )
+    if report["outcomes"]:
+        lines.append("\n**Outcomes:** " + ", ".join(f"{o['_id']} {o['jobs']}" for o in report["outcomes"]))
+    if len(lines) == 1:
+        lines.append("No jobs recorded yet.")
+    
+    await status_msg.edit_text("\n".join(lines))
+
 # ============ CANCEL COMMAND ============
 @bot.app.on_message(filters.command("cancel") & filters.private)
 async def cancel_command(client, message: Message):
     user_id = message.from_user.id
-    if user_id in bot.user_sessions:
-        del bot.user_sessions[user_id]
+    if await bot.cancel(user_id):
         await message.reply_text("❌ Current operation cancelled!")
     else:
         await message.reply_text("No active operation to cancel.")
@@ -245,7 +534,7 @@ async def callback_handler(client, callback_query):
         await callback_query.answer(stats_text, show_alert=True)
     
     elif data == "merge_sub":
-        bot.user_sessions[user_id] = {"action": "merge_subtitle", "step": 1}
+        bot.new_session(user_id, {"action": "merge_subtitle", "step": 1})
         await callback_query.message.reply_text(
             "📤 **Merge Subtitle to Video**\n\n"
             "Please send your video file (up to 4GB)\n\n"
@@ -254,7 +543,7 @@ async def callback_handler(client, callback_query):
         await callback_query.answer()
     
     elif data == "extract_sub":
-        bot.user_sessions[user_id] = {"action": "extract_subtitle", "step": 1}
+        bot.new_session(user_id, {"action": "extract_subtitle", "step": 1})
         await callback_query.message.reply_text(
             "📤 **Extract Subtitle from Video**\n\n"
             "Please send your video file\n\n"
@@ -263,25 +552,37 @@ async def callback_handler(client, callback_query):
         await callback_query.answer()
     
     elif data == "merge_audio":
-        bot.user_sessions[user_id] = {"action": "merge_audio", "step": 1}
+        bot.new_session(user_id, {"action": "merge_audio", "step": 1})
         await callback_query.message.reply_text(
             "🎵 **Merge Audio to Video**\n\n"
             "Please send your video file (up to 4GB)\n\n"
+            "🔊 Add `norm` as a caption to normalize the loudness of the new audio.\n\n"
+            "Use /cancel to stop this operation."
+        )
+        await callback_query.answer()
+    
+    elif data == "add_audio":
+        bot.new_session(user_id, {"action": "merge_audio", "step": 1, "mode": "add"})
+        await callback_query.message.reply_text(
+            "➕ **Add Audio Track**\n\n"
+            "Please send your video file (up to 4GB)\n\n"
+            "The original audio is kept and the new track is added without re-encoding.\n\n"
             "Use /cancel to stop this operation."
         )
         await callback_query.answer()
     
     elif data == "extract_audio":
-        bot.user_sessions[user_id] = {"action": "extract_audio", "step": 1}
+        bot.new_session(user_id, {"action": "extract_audio", "step": 1})
         await callback_query.message.reply_text(
             "📤 **Extract Audio from Video**\n\n"
             "Please send your video file\n\n"
+            "🔊 Add `norm` as a caption to normalize its loudness.\n\n"
             "Use /cancel to stop this operation."
         )
         await callback_query.answer()
     
     elif data == "remove_audio":
-        bot.user_sessions[user_id] = {"action": "remove_audio", "step": 1}
+        bot.new_session(user_id, {"action": "remove_audio", "step": 1})
         await callback_query.message.reply_text(
             "🔇 **Remove Audio from Video**\n\n"
             "Please send your video file\n\n"
@@ -289,6 +590,27 @@ async def callback_handler(client, callback_query):
         )
         await callback_query.answer()
     
+    elif data == "edit_tracks":
+        bot.new_session(user_id, {"action": "edit_tracks", "step": 1})
+        await callback_query.message.reply_text(
+            "🎚 **Edit Tracks**\n\n"
+            "Please send your video file (up to 4GB)\n\n"
+            "Use /cancel to stop this operation."
+        )
+        await callback_query.answer()
+    
+    elif data == "cancel_job":
+        if await bot.cancel(user_id):
+            await callback_query.answer("❌ Operation cancelled!")
+        else:
+            await callback_query.answer("No active operation to cancel.")
+    
+    elif data == "trk_apply" and bot.draining:
+        await callback_query.answer("🔄 The bot is restarting, please try again in a minute.", show_alert=True)
+    
+    elif data.startswith("trk_"):
+        await bot.track_handler.handle_callback(callback_query, bot.user_sessions.get(user_id))
+    
     elif data == "back_to_main":
         buttons = InlineKeyboardMarkup([
             [
@@ -300,7 +622,11 @@ async def callback_handler(client, callback_query):
                 InlineKeyboardButton("🔇 Remove Audio", callback_data="remove_audio")
             ],
             [
-                InlineKeyboardButton("📤 Extract Audio", callback_data="extract_audio")
+                InlineKeyboardButton("📤 Extract Audio", callback_data="extract_audio"),
+                InlineKeyboardButton("➕ Add Audio Track", callback_data="add_audio")
+            ],
+            [
+                InlineKeyboardButton("🎚 Edit Tracks", callback_data="edit_tracks")
             ],
             [
                 InlineKeyboardButton("ℹ️ Help", callback_data="help"),
@@ -328,20 +654,81 @@ async def document_handler(client, message: Message):
         )
         return
     
-    session = bot.user_sessions[user_id]
+    if bot.draining:
+        await message.reply_text(
+            "🔄 The bot is restarting for an update.\n"
+            "Please send your file again in a minute."
+        )
+        return
+    
+    # Work saved by the previous process goes first
+    await bot.resumed.wait()
+    await run_document(message, bot.user_sessions[user_id])
+
+async def run_document(message: Message, session: dict, charge: bool = True):
+    """Queue and run the job for a file sent in a session; resumed jobs were already charged"""
+    user_id = message.from_user.id
     action = session.get("action")
     
-    # Route to appropriate handler
-    if action == "merge_subtitle":
-        await bot.subtitle_handler.handle_merge_subtitle(message, session)
-    elif action == "extract_subtitle":
-        await bot.subtitle_handler.handle_extract_subtitle(message, session)
-    elif action == "merge_audio":
-        await bot.audio_handler.handle_merge_audio(message, session)
-    elif action == "extract_audio":
-        await bot.audio_handler.handle_extract_audio(message, session)
-    elif action == "remove_audio":
-        await bot.audio_handler.handle_remove_audio(message, session)
+    # Small jobs go ahead of multi-GB remuxes; the second file of a merge
+    # also pays for the video it is merged into
+    media = message.video or message.document or message.audio
+    file_size = media.file_size if media else 0
+    operation = "add_audio" if session.get("mode") == "add" else action
+    cost = job_scheduler.cost(operation, file_size + session.get("video_size", 0))
+    
+    # The second file of a merge belongs to the job its first file started
+    charged, day = file_size if charge else 0, bot.quota.today()
+    error = await bot.quota.check(user_id, charged, new_job=charge and session.get("step", 1) == 1)
+    if error:
+        await message.reply_text(error)
+        return
+    
+    async def run_job():
+        queued_msg = None
+        if not job_scheduler.has_free_slot(cost):
+            queued_msg = await message.reply_text(
+                "⏳ Bot is busy, your file is queued and will start shortly...\n\n"
+                "Use /cancel to leave the queue."
+            )
+        
+        async with job_scheduler.job(cost):
+            # The watchdog clock starts once the job holds a slot
+            job_registry.beat()
+            if queued_msg:
+                try:
+                    await queued_msg.delete()
+                except:
+                    pass
+            
+            # Route to appropriate handler
+            if action == "merge_subtitle":
+                await bot.subtitle_handler.handle_merge_subtitle(message, session)
+            elif action == "extract_subtitle":
+                await bot.subtitle_handler.handle_extract_subtitle(message, session)
+            elif action == "merge_audio":
+                await bot.audio_handler.handle_merge_audio(message, session)
+            elif action == "extract_audio":
+                await bot.audio_handler.handle_extract_audio(message, session)
+            elif action == "remove_audio":
+                await bot.audio_handler.handle_remove_audio(message, session)
+            elif action == "edit_tracks":
+                await bot.track_handler.handle_edit_tracks(message, session)
+    
+    outcome = None
+    try:
+        # Its own task, so /cancel or the Cancel button can stop it at any await
+        outcome = await job_registry.run(
+            user_id, run_job(), watchdog.max_duration(file_size + session.get("video_size", 0)),
+            operation=operation, step=session.get("step", 1), input_bytes=file_size,
+            resume={
+                "kind": "document", "chat_id": message.chat.id, "message_id": message.id,
+                "session": PendingJobs.snapshot(session)
+            }
+        )
+    finally:
+        # Bytes of a job that produced nothing are given back; a deferred job resumes already paid for
+        bot.quota.finish(user_id, 0 if outcome in ("ok", "deferred") else charged, day)
 
 if __name__ == "__main__":
     bot.app.run(bot.start())
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class DatabaseSetup:
+    """Index bootstrap and a query-plan self-check for the bot's hot queries"""
+
+    # collection -> [(keys, options)] the bot's hot queries depend on
+    INDEXES = {
+        "users": [
+            # add_user / get_user_stats / increment_stat look users up by user_id
+            ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+            # Ban checks only ever ask for banned users, a tiny slice of the collection
+            ([("is_banned", ASCENDING)], {
+                "name": "is_banned_partial",
+                "partialFilterExpression": {"is_banned": True},
+            }),
+        ],
+        "jobs": [
+            # Job history expires on its own; analytics also match on created_at
+            ([("created_at", ASCENDING)], {
+                "name": "created_at_ttl",
+                "expireAfterSeconds": getattr(Config, "JOB_HISTORY_TTL_DAYS", 30) * 86400,
+            }),
+            # Sorted run times per operation for the percentile fallback
+            ([("operation", ASCENDING), ("step", ASCENDING), ("outcome", ASCENDING), ("duration", ASCENDING)], {
+                "name": "operation_duration",
+            }),
+        ],
+    }
+
+    # collection -> (filter, index that should serve it) for the self-check
+    HOT_QUERIES = {
+        "users": [
+            # Also the /stats read (get_user_stats)
+            ({"user_id": 0}, "user_id_unique"),
+            ({"is_banned": True}, "is_banned_partial"),
+        ],
+        "jobs": [
+            # /analytics matches the window first, then sorts run times per operation
+            ({"created_at": {"$gte": datetime.fromtimestamp(0, timezone.utc)}}, "created_at_ttl"),
+            ({"operation": "", "step": 1, "outcome": "ok"}, "operation_duration"),
+        ],
+    }
+
+    async def ensure(self, database):
+        """Create missing indexes, verify them and explain the hot queries; safe to run on every start"""
+        if database is None:
+            return
+
+        try:
+            for name, indexes in self.INDEXES.items():
+                collection = database[name]
+                for keys, options in indexes:
+                    try:
+                        await collection.create_index(keys, **options)
+                    except OperationFailure as e:
+                        if e.code == 85 and "expireAfterSeconds" in options:
+                            # TTL changed in Config: update it in place
+                            await database.command("collMod", name, index={
+                                "name": options["name"],
+                                "expireAfterSeconds": options["expireAfterSeconds"],
+                            })
+                            continue
+                        # e.g. duplicates blocking a unique index, or an older index
+                        # with the same keys and different options
+                        logger.error(f"Could not create index {options['name']} on {name}: {e}")
+
+                await self._verify(collection, indexes)
+
+            await self.self_check(database)
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {e}")
+
+    async def _verify(self, collection, indexes):
+        existing = {}
+        async for index in collection.list_indexes():
+            existing[index["name"]] = index
+
+        for keys, options in indexes:
+            index = existing.get(options["name"])
+            if (
+                index is None
+                or list(index["key"].items()) != keys
+                or index.get("unique", False) != options.get("unique", False)
+                or index.get("partialFilterExpression") != options.get("partialFilterExpression")
+                or index.get("expireAfterSeconds") != options.get("expireAfterSeconds")
+            ):
+                logger.warning(f"Index {options['name']} on {collection.name} is missing or differs")
+
+    async def self_check(self, database):
+        """Warn when a hot query would scan the whole collection"""
+        for name, queries in self.HOT_QUERIES.items():
+            for query, expected in queries:
+                try:
+                    plan = await database[name].find(query).limit(1).explain()
+                except Exception as e:
+                    logger.error(f"Explain failed on {name} {query}: {e}")
+                    continue
+
+                stages = self._stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+                if "COLLSCAN" in stages:
+                    logger.warning(f"COLLSCAN for {name} {query}; expected index {expected}")
+
+    def _stages(self, plan):
+        """Every stage name in a winning plan tree"""
+        stages = [plan.get("stage")]
+        for child in ("inputStage", "queryPlan"):
+            if isinstance(plan.get(child), dict):
+                stages += self._stages(plan[child])
+        for child in plan.get("inputStages", []):
+            stages += self._stages(child)
+        return stages
@@ -1,24 +1,43 @@
-import os
-import time
+import asyncio
+import re
+import aiofiles.os
 from pyrogram.types import Message
 from utils.ffmpeg_helper import FFmpegHelper
 from utils.file_helper import FileHelper
+from utils.transfer_helper import TransferHelper
+from utils.progress_manager import progress_manager
+from utils.output_helper import OutputHelper
+from utils.job_registry import job_registry
+from utils.loudness_cache import LoudnessCache
+from utils.metrics import metrics
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
 class AudioHandler:
+    # Caption words that ask for loudness normalization
+    NORMALIZE_WORDS = {"norm", "normalize", "loudnorm"}
+    
+    # Track delay in a caption: plain signed seconds, so "inf", "nan" or "1e9" never reach ffmpeg
+    OFFSET_PATTERN = re.compile(r"^[+-]?\d+(\.\d+)?$")
+    MAX_TRACK_OFFSET = 600.0
+    
     def __init__(self, app, db):
         self.app = app
         self.db = db
         self.ffmpeg = FFmpegHelper()
         self.file_helper = FileHelper()
+        self.transfer = TransferHelper()
+        self.output = OutputHelper()
+        self.loudness = LoudnessCache(db)
+        self.normalize_default = getattr(Config, "LOUDNORM_DEFAULT", False)
     
     async def handle_merge_audio(self, message: Message, session: dict):
         """Handle audio merging process"""
         user_id = message.from_user.id
         step = session.get("step", 1)
+        audio_path = None
         
         try:
             if step == 1:
@@ -35,21 +54,23 @@ class AudioHandler:
                     )
                     return
                 
-                status_msg = await message.reply_text("⏬ Downloading video file...")
+                status_msg = await job_registry.reply_status(message, "⏬ Downloading video file...")
                 
-                video_path = await self.file_helper.download_file(
+                video_path = await self.transfer.download_file(
                     self.app, message, status_msg
                 )
                 
                 if not video_path:
-                    await status_msg.edit_text("❌ Failed to download video!")
+                    await progress_manager.edit(status_msg, "❌ Failed to download video!")
                     return
                 
                 session["step"] = 2
                 session["video_path"] = video_path
                 session["video_size"] = file_size
+                session["normalize"] = self._wants_normalize(message.caption)
                 
-                await status_msg.edit_text(
+                await progress_manager.edit(
+                    status_msg,
                     "✅ Video downloaded successfully!\n\n"
                     "🎵 Now send your audio file"
                 )
@@ -60,44 +81,91 @@ class AudioHandler:
                     await message.reply_text("❌ Please send a valid audio file!")
                     return
                 
-                status_msg = await message.reply_text("⏬ Downloading audio file...")
+                status_msg = await job_registry.reply_status(message, "⏬ Downloading audio file...")
                 
-                audio_path = await self.file_helper.download_file(
+                audio_path = await self.transfer.download_file(
                     self.app, message, status_msg
                 )
                 
                 if not audio_path:
-                    await status_msg.edit_text("❌ Failed to download audio!")
+                    await progress_manager.edit(status_msg, "❌ Failed to download audio!")
                     return
                 
-                await status_msg.edit_text("🔄 Merging audio to video...\nThis may take a while...")
+                # The added track is stream-copied, so only a replacing merge is normalized
+                measuring = None
+                if session.get("mode") != "add" and (
+                    session.get("normalize") or self._wants_normalize(message.caption)
+                ):
+                    # Measure the new audio while the video is probed and the output planned
+                    measuring = asyncio.create_task(self._measure_loudness(message.audio or message.document, audio_path))
+                    job_registry.track_task(measuring)
                 
                 video_path = session.get("video_path")
-                output_path = video_path.rsplit(".", 1)[0] + "_audio_merged.mp4"
+                info = await self.ffmpeg.probe(video_path)
+                duration = float((info or {}).get("format", {}).get("duration", 0) or 0)
+                
+                if session.get("mode") == "add":
+                    # Keep existing tracks and stream-copy the new one
+                    await progress_manager.edit(status_msg, "➕ Adding audio track...")
+                    offset, language = self._parse_track_caption(message.caption)
+                    extension = await self.ffmpeg.audio_track_container(video_path, audio_path)
+                    output_path = self.output.job_path(video_path, f"_audio_added.{extension}")
+                    estimated_size = self.ffmpeg.estimate_output_size(info, extra_bytes=await aiofiles.os.path.getsize(audio_path))
+                else:
+                    await progress_manager.edit(status_msg, "🔄 Merging audio to video...\nThis may take a while...")
+                    output_path = self.output.job_path(video_path, "_audio_merged.mp4")
+                    # Video is copied, the new audio is re-encoded at roughly 192 kbps
+                    estimated_size = self.ffmpeg.estimate_output_size(
+                        info, keep=lambda stream: stream.get("codec_type") == "video",
+                        extra_bytes=int(duration * 192000 / 8)
+                    )
                 
-                success = await self.ffmpeg.merge_audio(
-                    video_path, audio_path, output_path, status_msg
+                parts = self.output.plan_parts(
+                    self.app, user_id, output_path, estimated_size, duration,
+                    "✅ **Audio merged successfully!**", status_msg
                 )
+                segment_time = parts.segment_time if parts else None
+                on_segment = parts.add if parts else None
                 
-                if success and os.path.exists(output_path):
-                    await status_msg.edit_text("📤 Uploading merged video...")
+                if session.get("mode") == "add":
+                    success = await self.ffmpeg.add_audio_track(
+                        video_path, audio_path, output_path, offset, language, status_msg,
+                        segment_time=segment_time, on_segment=on_segment
+                    )
+                else:
+                    stream, loudness = await measuring if measuring else (None, None)
+                    if loudness:
+                        await progress_manager.edit(
+                            status_msg, "🔄 Merging audio to video...\n🔊 Normalizing loudness\nThis may take a while..."
+                        )
+                    success = await self.ffmpeg.merge_audio(
+                        video_path, audio_path, output_path, status_msg,
+                        segment_time=segment_time, on_segment=on_segment,
+                        stream=stream, loudness=loudness
+                    )
+                
+                if success and (parts or await aiofiles.os.path.exists(output_path)):
+                    await progress_manager.edit(status_msg, "📤 Uploading merged video...")
                     
                     try:
-                        await self.app.send_video(
-                            chat_id=user_id,
-                            video=output_path,
-                            caption="✅ **Audio merged successfully!**\n\n"
-                                    f"📁 File size: {self.file_helper.format_size(os.path.getsize(output_path))}\n"
-                                    f"⚡ Processed by @YourBotUsername",
-                            progress=self.file_helper.upload_progress,
-                            progress_args=(status_msg, time.time())
-                        )
+                        if parts:
+                            await parts.finish()
+                        else:
+                            await self.output.send_video(
+                                self.app,
+                                user_id,
+                                output_path,
+                                "✅ **Audio merged successfully!**\n\n"
+                                f"📁 File size: {self.file_helper.format_size(await aiofiles.os.path.getsize(output_path))}\n"
+                                f"⚡ Processed by @YourBotUsername",
+                                status_msg
+                            )
                         
                         await self.db.increment_stat(user_id, "videos_processed")
                         await self.db.increment_stat(user_id, "audio_merged")
                         await self.db.update_size_processed(user_id, session.get("video_size", 0))
                         
-                        await status_msg.edit_text("✅ Video uploaded successfully!")
+                        await progress_manager.edit(status_msg, "✅ Video uploaded successfully!")
                         
                         try:
                             await self.app.send_message(
@@ -112,60 +180,109 @@ class AudioHandler:
                     
                     except Exception as e:
                         logger.error(f"Upload error: {e}")
-                        await status_msg.edit_text(f"❌ Upload failed: {str(e)}")
+                        await progress_manager.edit(status_msg, f"❌ Upload failed: {str(e)}")
                     
-                    self.file_helper.cleanup_files([video_path, audio_path, output_path])
+                    await asyncio.to_thread(self.file_helper.cleanup_files, [output_path])
+                    self.output.cleanup(output_path)
                 else:
-                    await status_msg.edit_text("❌ Failed to merge audio!")
-                    self.file_helper.cleanup_files([video_path, audio_path])
+                    await progress_manager.edit(status_msg, "❌ Failed to merge audio!")
+                
+                # Popped so the error path below gives back only what is still held
+                self.transfer.release(session.pop("video_path"), audio_path)
+                audio_path = None
+                
+                if parts:
+                    parts.abort()
+                    parts.cleanup()
                 
                 if user_id in self.app.user_sessions:
                     del self.app.user_sessions[user_id]
         
         except Exception as e:
             logger.error(f"Error in merge audio: {e}")
+            job_registry.fail()
             await message.reply_text(f"❌ An error occurred: {str(e)}")
-            if "video_path" in session:
-                self.file_helper.cleanup_files([session.get("video_path")])
+            self.transfer.release(session.pop("video_path", None), audio_path)
             if user_id in self.app.user_sessions:
                 del self.app.user_sessions[user_id]
     
+    def _wants_normalize(self, caption: str):
+        words = {word.lower() for word in (caption or "").split()}
+        return self.normalize_default or bool(words & self.NORMALIZE_WORDS)
+    
+    async def _measure_loudness(self, media, path: str):
+        """Main audio stream of path and its loudness, measured once per stream and then cached"""
+        stream = self.ffmpeg.main_audio_stream(await self.ffmpeg.probe(path))
+        if stream is None:
+            return None, None
+        
+        key = self.loudness.key(media, stream["index"])
+        loudness = await self.loudness.get(key)
+        if loudness is not None:
+            metrics.incr("loudness_cache_hits")
+            return stream, loudness
+        
+        metrics.incr("loudness_measured")
+        loudness = await self.ffmpeg.measure_loudness(path, stream["index"])
+        if loudness:
+            await self.loudness.put(key, loudness)
+        return stream, loudness
+    
+    def _parse_track_caption(self, caption: str):
+        """Read an optional offset in seconds and language code, e.g. "+1.5 hin" """
+        offset, language = 0.0, None
+        for token in (caption or "").split():
+            if self.OFFSET_PATTERN.match(token):
+                offset = max(-self.MAX_TRACK_OFFSET, min(self.MAX_TRACK_OFFSET, float(token)))
+            elif token.isalpha() and len(token) == 3:
+                language = token.lower()
+        return offset, language
+    
     async def handle_extract_audio(self, message: Message, session: dict):
         """Handle audio extraction process"""
         user_id = message.from_user.id
+        video_path = None
         
         try:
             if not (message.video or message.document):
                 await message.reply_text("❌ Please send a valid video file!")
                 return
             
-            status_msg = await message.reply_text("⏬ Downloading video file...")
+            status_msg = await job_registry.reply_status(message, "⏬ Downloading video file...")
             
-            video_path = await self.file_helper.download_file(
+            video_path = await self.transfer.download_file(
                 self.app, message, status_msg
             )
             
             if not video_path:
-                await status_msg.edit_text("❌ Failed to download video!")
+                await progress_manager.edit(status_msg, "❌ Failed to download video!")
                 return
             
-            await status_msg.edit_text("🎵 Extracting audio...")
+            stream = loudness = None
+            if self._wants_normalize(message.caption):
+                await progress_manager.edit(status_msg, "🔊 Measuring loudness...")
+                stream, loudness = await self._measure_loudness(message.video or message.document, video_path)
+            
+            await progress_manager.edit(status_msg, "🎵 Extracting audio...")
             
-            audio_path = video_path.rsplit(".", 1)[0] + ".mp3"
-            success = await self.ffmpeg.extract_audio(video_path, audio_path)
+            audio_path = self.output.job_path(video_path, ".mp3")
+            success = await self.ffmpeg.extract_audio(video_path, audio_path, stream, loudness)
             
-            if success and os.path.exists(audio_path):
+            if success and await aiofiles.os.path.exists(audio_path):
                 try:
-                    await self.app.send_audio(
-                        chat_id=user_id,
-                        audio=audio_path,
-                        caption="✅ **Audio extracted successfully!**\n\n"
-                                "⚡ Processed by @YourBotUsername"
+                    await self.output.send_audio(
+                        self.app,
+                        user_id,
+                        audio_path,
+                        "✅ **Audio extracted successfully!**\n\n"
+                        + (f"🔊 Loudness normalized to {self.ffmpeg.loudnorm_i} LUFS\n" if loudness else "")
+                        + "⚡ Processed by @YourBotUsername",
+                        status_msg
                     )
                     
                     await self.db.increment_stat(user_id, "audio_extracted")
                     
-                    await status_msg.edit_text("✅ Audio uploaded successfully!")
+                    await progress_manager.edit(status_msg, "✅ Audio uploaded successfully!")
                     
                     try:
                         await self.app.send_message(
@@ -179,25 +296,29 @@ class AudioHandler:
                 
                 except Exception as e:
                     logger.error(f"Upload error: {e}")
-                    await status_msg.edit_text(f"❌ Upload failed: {str(e)}")
+                    await progress_manager.edit(status_msg, f"❌ Upload failed: {str(e)}")
                 
-                self.file_helper.cleanup_files([video_path, audio_path])
+                await asyncio.to_thread(self.file_helper.cleanup_files, [audio_path])
             else:
-                await status_msg.edit_text("❌ Failed to extract audio!")
-                self.file_helper.cleanup_files([video_path])
+                await progress_manager.edit(status_msg, "❌ Failed to extract audio!")
             
             if user_id in self.app.user_sessions:
                 del self.app.user_sessions[user_id]
         
         except Exception as e:
             logger.error(f"Error in extract audio: {e}")
+            job_registry.fail()
             await message.reply_text(f"❌ An error occurred: {str(e)}")
             if user_id in self.app.user_sessions:
                 del self.app.user_sessions[user_id]
+        
+        finally:
+            self.transfer.release(video_path)
     
     async def handle_remove_audio(self, message: Message, session: dict):
         """Handle audio removal process"""
         user_id = message.from_user.id
+        video_path = None
         
         try:
             if not (message.video or message.document):
@@ -206,40 +327,55 @@ class AudioHandler:
             
             file_size = message.video.file_size if message.video else message.document.file_size
             
-            status_msg = await message.reply_text("⏬ Downloading video file...")
+            status_msg = await job_registry.reply_status(message, "⏬ Downloading video file...")
             
-            video_path = await self.file_helper.download_file(
+            video_path = await self.transfer.download_file(
                 self.app, message, status_msg
             )
             
             if not video_path:
-                await status_msg.edit_text("❌ Failed to download video!")
+                await progress_manager.edit(status_msg, "❌ Failed to download video!")
                 return
             
-            await status_msg.edit_text("🔇 Removing audio from video...")
+            await progress_manager.edit(status_msg, "🔇 Removing audio from video...")
             
-            output_path = video_path.rsplit(".", 1)[0] + "_no_audio.mp4"
-            success = await self.ffmpeg.remove_audio(video_path, output_path, status_msg)
+            output_path = self.output.job_path(video_path, "_no_audio.mp4")
+            info = await self.ffmpeg.probe(video_path)
+            parts = self.output.plan_parts(
+                self.app, user_id, output_path,
+                self.ffmpeg.estimate_output_size(info, keep=lambda stream: stream.get("codec_type") == "video"),
+                float((info or {}).get("format", {}).get("duration", 0) or 0),
+                "✅ **Audio removed successfully!**", status_msg
+            )
             
-            if success and os.path.exists(output_path):
-                await status_msg.edit_text("📤 Uploading video...")
+            success = await self.ffmpeg.remove_audio(
+                video_path, output_path, status_msg,
+                segment_time=parts.segment_time if parts else None,
+                on_segment=parts.add if parts else None
+            )
+            
+            if success and (parts or await aiofiles.os.path.exists(output_path)):
+                await progress_manager.edit(status_msg, "📤 Uploading video...")
                 
                 try:
-                    await self.app.send_video(
-                        chat_id=user_id,
-                        video=output_path,
-                        caption="✅ **Audio removed successfully!**\n\n"
-                                f"📁 File size: {self.file_helper.format_size(os.path.getsize(output_path))}\n"
-                                f"⚡ Processed by @YourBotUsername",
-                        progress=self.file_helper.upload_progress,
-                        progress_args=(status_msg, time.time())
-                    )
+                    if parts:
+                        await parts.finish()
+                    else:
+                        await self.output.send_video(
+                            self.app,
+                            user_id,
+                            output_path,
+                            "✅ **Audio removed successfully!**\n\n"
+                            f"📁 File size: {self.file_helper.format_size(await aiofiles.os.path.getsize(output_path))}\n"
+                            f"⚡ Processed by @YourBotUsername",
+                            status_msg
+                        )
                     
                     await self.db.increment_stat(user_id, "videos_processed")
                     await self.db.increment_stat(user_id, "audio_removed")
                     await self.db.update_size_processed(user_id, file_size)
                     
-                    await status_msg.edit_text("✅ Video uploaded successfully!")
+                    await progress_manager.edit(status_msg, "✅ Video uploaded successfully!")
                     
                     try:
                         await self.app.send_message(
@@ -254,18 +390,26 @@ class AudioHandler:
                 
                 except Exception as e:
                     logger.error(f"Upload error: {e}")
-                    await status_msg.edit_text(f"❌ Upload failed: {str(e)}")
+                    await progress_manager.edit(status_msg, f"❌ Upload failed: {str(e)}")
                 
-                self.file_helper.cleanup_files([video_path, output_path])
+                await asyncio.to_thread(self.file_helper.cleanup_files, [output_path])
+                self.output.cleanup(output_path)
             else:
-                await status_msg.edit_text("❌ Failed to remove audio!")
-                self.file_helper.cleanup_files([video_path])
+                await progress_manager.edit(status_msg, "❌ Failed to remove audio!")
+            
+            if parts:
+                parts.abort()
+                parts.cleanup()
             
             if user_id in self.app.user_sessions:
                 del self.app.user_sessions[user_id]
         
         except Exception as e:
             logger.error(f"Error in remove audio: {e}")
+            job_registry.fail()
             await message.reply_text(f"❌ An error occurred: {str(e)}")
             if user_id in self.app.user_sessions:
                 del self.app.user_sessions[user_id]
+        
+        finally:
+            self.transfer.release(video_path)
@@ -1,6 +1,7 @@
 import asyncio
 from pyrogram import filters
 from pyrogram.types import Message
+from utils.progress_manager import progress_manager
 from config import Config
 import logging
 
@@ -90,7 +91,8 @@ class BroadcastHandler:
         success_count = 0
         failed_count = 0
         
-        await status_msg.edit_text(
+        await progress_manager.edit(
+            status_msg,
             f"📡 **Broadcasting...**\n\n"
             f"Total Users: {total_users}\n"
             f"Progress: 0/{total_users}"
@@ -115,7 +117,8 @@ class BroadcastHandler:
                 
                 # Update progress every 10 users
                 if i % 10 == 0:
-                    await status_msg.edit_text(
+                    progress_manager.update(
+                        status_msg,
                         f"📡 **Broadcasting...**\n\n"
                         f"Total Users: {total_users}\n"
                         f"Progress: {i}/{total_users}\n"
@@ -131,7 +134,8 @@ class BroadcastHandler:
                 failed_count += 1
         
         # Final status
-        await status_msg.edit_text(
+        await progress_manager.edit(
+            status_msg,
             f"✅ **Broadcast Completed!**\n\n"
             f"Total Users: {total_users}\n"
             f"✅ Success: {success_count}\n"
@@ -164,7 +168,8 @@ class BroadcastHandler:
         success_count = 0
         failed_count = 0
         
-        await status_msg.edit_text(
+        await progress_manager.edit(
+            status_msg,
             f"📡 **Broadcasting...**\n\n"
             f"Total Users: {total_users}\n"
             f"Progress: 0/{total_users}"
@@ -186,7 +191,8 @@ class BroadcastHandler:
                 
                 # Update progress every 10 users
                 if i % 10 == 0:
-                    await status_msg.edit_text(
+                    progress_manager.update(
+                        status_msg,
                         f"📡 **Broadcasting...**\n\n"
                         f"Total Users: {total_users}\n"
                         f"Progress: {i}/{total_users}\n"
@@ -202,7 +208,8 @@ class BroadcastHandler:
                 failed_count += 1
         
         # Final status
-        await status_msg.edit_text(
+        await progress_manager.edit(
+            status_msg,
             f"✅ **Broadcast Completed!**\n\n"
             f"Total Users: {total_users}\n"
             f"✅ Success: {success_count}\n"
@@ -0,0 +1,306 @@
+import asyncio
+import aiofiles.os
+from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from utils.ffmpeg_helper import FFmpegHelper
+from utils.file_helper import FileHelper
+from utils.transfer_helper import TransferHelper
+from utils.progress_manager import progress_manager
+from utils.output_helper import OutputHelper
+from utils.job_registry import job_registry
+from utils.watchdog import watchdog
+from utils.job_scheduler import job_scheduler
+from utils.pending_jobs import PendingJobs
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TrackHandler:
+    """Edit audio and subtitle tracks in a single stream-copy remux"""
+
+    # Language codes offered by the 🌐 button, cycled in this order
+    LANGUAGES = ["eng", "hin", "tam", "tel", "mal", "kan", "ben", "spa", "fre", "ger", "jpn", "kor", "und"]
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.ffmpeg = FFmpegHelper()
+        self.file_helper = FileHelper()
+        self.transfer = TransferHelper()
+        self.output = OutputHelper()
+
+    async def handle_edit_tracks(self, message: Message, session: dict):
+        """Download the video and show its tracks"""
+        user_id = message.from_user.id
+
+        if session.get("step", 1) > 1:
+            # The session already holds a video; a second download would leak it
+            await message.reply_text(
+                "⚠️ You are already editing a video.\n"
+                "Use the buttons above, or /cancel to start over."
+            )
+            return
+
+        try:
+            if not (message.video or message.document):
+                await message.reply_text("❌ Please send a valid video file!")
+                return
+
+            file_size = message.video.file_size if message.video else message.document.file_size
+            if file_size > Config.MAX_FILE_SIZE:
+                await message.reply_text(
+                    f"❌ File size exceeds 4GB limit!\n"
+                    f"Your file: {self.file_helper.format_size(file_size)}"
+                )
+                return
+
+            status_msg = await job_registry.reply_status(message, "⏬ Downloading video file...")
+
+            video_path = await self.transfer.download_file(self.app, message, status_msg)
+
+            if not video_path:
+                await progress_manager.edit(status_msg, "❌ Failed to download video!")
+                return
+
+            info = await self.ffmpeg.probe(video_path)
+            tracks = self._tracks_from_probe(info)
+
+            if not tracks:
+                await progress_manager.edit(status_msg, "❌ No audio or subtitle tracks found!")
+                self.transfer.release(video_path)
+                if user_id in self.app.user_sessions:
+                    del self.app.user_sessions[user_id]
+                return
+
+            session["step"] = 2
+            session["video_path"] = video_path
+            session["video_size"] = file_size
+            session["tracks"] = tracks
+            session["status_msg"] = status_msg
+
+            await progress_manager.edit(status_msg, self._render_text(tracks), self._render_keyboard(tracks))
+
+        except Exception as e:
+            logger.error(f"Error in edit tracks: {e}")
+            job_registry.fail()
+            await message.reply_text(f"❌ An error occurred: {str(e)}")
+            if "video_path" in session:
+                self.transfer.release(session.get("video_path"))
+            if user_id in self.app.user_sessions:
+                del self.app.user_sessions[user_id]
+
+    async def handle_callback(self, callback_query, session: dict):
+        """Handle track keyboard buttons"""
+        if not session or session.get("action") != "edit_tracks" or "tracks" not in session:
+            await callback_query.answer("❌ This track editor has expired.", show_alert=True)
+            return
+
+        if session.get("step") == 3:
+            await callback_query.answer("⏳ Already processing...")
+            return
+
+        tracks = session["tracks"]
+        action, _, position = callback_query.data[len("trk_"):].partition("_")
+
+        if action == "apply":
+            await callback_query.answer()
+            await self.apply(callback_query.from_user, session)
+            return
+
+        if action == "cancel":
+            await callback_query.answer("Cancelled")
+            await progress_manager.edit(session["status_msg"], "❌ Track editing cancelled!")
+            self.transfer.release(session.get("video_path"))
+            if callback_query.from_user.id in self.app.user_sessions:
+                del self.app.user_sessions[callback_query.from_user.id]
+            return
+
+        # Buttons of an older editor can point past the current track list
+        i = int(position) if position.isdigit() else -1
+        if not 0 <= i < len(tracks):
+            await callback_query.answer("❌ This track editor has expired.", show_alert=True)
+            return
+        if action == "up" and i == 0:
+            await callback_query.answer("⬆️ Already the first track.")
+            return
+        track = tracks[i]
+
+        if action == "keep":
+            track["keep"] = not track["keep"]
+            if not track["keep"]:
+                track["default"] = False
+        elif action == "def":
+            # Only one default track per type
+            for other in tracks:
+                if other["type"] == track["type"] and other is not track:
+                    other["default"] = False
+            track["default"] = not track["default"]
+            track["keep"] = track["keep"] or track["default"]
+        elif action == "up":
+            tracks[i - 1], tracks[i] = tracks[i], tracks[i - 1]
+        elif action == "lang":
+            current = track["language"] if track["language"] in self.LANGUAGES else self.LANGUAGES[-1]
+            track["language"] = self.LANGUAGES[(self.LANGUAGES.index(current) + 1) % len(self.LANGUAGES)]
+
+        await callback_query.answer()
+        await progress_manager.edit(session["status_msg"], self._render_text(tracks), self._render_keyboard(tracks))
+
+    async def apply(self, user, session: dict):
+        """Run the remux as a job of user; also used to resume it after a restart"""
+        session["step"] = 3
+        await job_registry.run(
+            user.id,
+            self._queued_apply(user, session),
+            watchdog.max_duration(session.get("video_size", 0)),
+            operation="edit_tracks", step=3, input_bytes=session.get("video_size", 0),
+            resume={"kind": "edit_tracks", "session": PendingJobs.snapshot(session)}
+        )
+
+    async def _queued_apply(self, user, session: dict):
+        """Wait for a scheduler slot, then apply"""
+        job_registry.track_status(session["status_msg"])
+        async with job_scheduler.job(job_scheduler.cost("edit_tracks", session.get("video_size", 0))):
+            job_registry.beat()
+            await self._apply(user, session)
+
+    async def _apply(self, user, session: dict):
+        """Run the remux with the chosen tracks and upload the result"""
+        user_id = user.id
+        status_msg = session["status_msg"]
+        video_path = session["video_path"]
+        tracks = [t for t in session["tracks"] if t["keep"]]
+
+        try:
+            await progress_manager.edit(status_msg, "🎚 Remuxing tracks...")
+
+            extension = video_path.rsplit(".", 1)[-1].lower()
+            if extension not in ("mp4", "mkv"):
+                extension = "mkv"
+            output_path = self.output.job_path(video_path, f"_tracks.{extension}")
+
+            info = await self.ffmpeg.probe(video_path)
+            kept = {t["index"] for t in tracks}
+            parts = self.output.plan_parts(
+                self.app, user_id, output_path,
+                self.ffmpeg.estimate_output_size(
+                    info, keep=lambda stream: stream.get("codec_type") not in ("audio", "subtitle")
+                    or stream["index"] in kept
+                ),
+                float((info or {}).get("format", {}).get("duration", 0) or 0),
+                "✅ **Tracks updated successfully!**", status_msg
+            )
+
+            success = await self.ffmpeg.remux_tracks(
+                video_path, output_path, tracks, status_msg,
+                segment_time=parts.segment_time if parts else None,
+                on_segment=parts.add if parts else None
+            )
+
+            if success and (parts or await aiofiles.os.path.exists(output_path)):
+                await progress_manager.edit(status_msg, "📤 Uploading video...")
+
+                try:
+                    if parts:
+                        await parts.finish()
+                    else:
+                        await self.output.send_video(
+                            self.app,
+                            user_id,
+                            output_path,
+                            "✅ **Tracks updated successfully!**\n\n"
+                            f"📁 File size: {self.file_helper.format_size(await aiofiles.os.path.getsize(output_path))}\n"
+                            f"⚡ Processed by @YourBotUsername",
+                            status_msg
+                        )
+
+                    await self.db.increment_stat(user_id, "videos_processed")
+                    await self.db.increment_stat(user_id, "tracks_edited")
+                    await self.db.update_size_processed(user_id, session.get("video_size", 0))
+
+                    await progress_manager.edit(status_msg, "✅ Video uploaded successfully!")
+
+                    try:
+                        await self.app.send_message(
+                            Config.LOG_CHANNEL,
+                            f"✅ **Tracks Edited**\n\n"
+                            f"User: {user.mention}\n"
+                            f"ID: `{user_id}`\n"
+                            f"Size: {self.file_helper.format_size(session.get('video_size', 0))}"
+                        )
+                    except:
+                        pass
+
+                except Exception as e:
+                    logger.error(f"Upload error: {e}")
+                    await progress_manager.edit(status_msg, f"❌ Upload failed: {str(e)}")
+
+                await asyncio.to_thread(self.file_helper.cleanup_files, [output_path])
+                self.transfer.release(video_path)
+                self.output.cleanup(output_path)
+            else:
+                await progress_manager.edit(status_msg, "❌ Failed to edit tracks!")
+                self.transfer.release(video_path)
+
+            if parts:
+                parts.abort()
+                parts.cleanup()
+
+            if user_id in self.app.user_sessions:
+                del self.app.user_sessions[user_id]
+
+        except Exception as e:
+            logger.error(f"Error in apply tracks: {e}")
+            job_registry.fail()
+            await progress_manager.edit(status_msg, f"❌ An error occurred: {str(e)}")
+            self.transfer.release(video_path)
+            if user_id in self.app.user_sessions:
+                del self.app.user_sessions[user_id]
+
+    def _tracks_from_probe(self, info):
+        """Build the editable track list from a cached probe"""
+        tracks = []
+        for stream in (info or {}).get("streams", []):
+            if stream.get("codec_type") not in ("audio", "subtitle"):
+                continue
+            tags = stream.get("tags", {})
+            tracks.append({
+                "index": stream["index"],
+                "type": stream["codec_type"],
+                "codec": stream.get("codec_name", "?"),
+                "language": tags.get("language", "und"),
+                "title": tags.get("title", ""),
+                "keep": True,
+                "default": bool(stream.get("disposition", {}).get("default")),
+            })
+        return tracks
+
+    def _render_text(self, tracks):
+        lines = ["🎚 **Track Editor**\n"]
+        for track in tracks:
+            icon = "🎵" if track["type"] == "audio" else "📝"
+            state = "✅" if track["keep"] else "❌"
+            default = " ⭐" if track["default"] else ""
+            title = f" – {track['title']}" if track["title"] else ""
+            lines.append(f"{state} {icon} {track['language']} ({track['codec']}){title}{default}")
+        lines.append(
+            "\n✅/❌ keep or drop • ⭐ default • ⬆️ move up • 🌐 language\n"
+            "Press **Apply** to remux once with your choices."
+        )
+        return "\n".join(lines)
+
+    def _render_keyboard(self, tracks):
+        rows = []
+        for i, track in enumerate(tracks):
+            icon = "🎵" if track["type"] == "audio" else "📝"
+            state = "✅" if track["keep"] else "❌"
+            rows.append([
+                InlineKeyboardButton(f"{state} {icon} {track['language']}", callback_data=f"trk_keep_{i}"),
+                InlineKeyboardButton("⭐" if track["default"] else "☆", callback_data=f"trk_def_{i}"),
+                InlineKeyboardButton("⬆️", callback_data=f"trk_up_{i}"),
+                InlineKeyboardButton("🌐", callback_data=f"trk_lang_{i}"),
+            ])
+        rows.append([
+            InlineKeyboardButton("✅ Apply", callback_data="trk_apply"),
+            InlineKeyboardButton("❌ Cancel", callback_data="trk_cancel"),
+        ])
+        return InlineKeyboardMarkup(rows)
@@ -0,0 +1,26 @@
+import asyncio
+import logging
+import aiofiles.os
+
+logger = logging.getLogger(__name__)
+
+# Background deletions, referenced until they finish
+_pending = set()
+
+async def remove(*paths):
+    """Delete files in a worker thread; unlinking a multi-GB file can take a while"""
+    for path in paths:
+        if not path:
+            continue
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing {path}: {e}")
+
+def remove_soon(*paths):
+    """remove() for synchronous code: schedule the deletion and return at once"""
+    task = asyncio.get_running_loop().create_task(remove(*paths))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
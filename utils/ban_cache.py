@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from pymongo.errors import OperationFailure, PyMongoError
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class BanCache:
+    """Banned user ids in memory, kept fresh by a change stream or by polling"""
+
+    # Only changes that can flip a ban reach us
+    PIPELINE = [{"$match": {"$or": [
+        {"operationType": {"$in": ["insert", "replace", "delete"]}},
+        {"updateDescription.updatedFields.is_banned": {"$exists": True}},
+        {"updateDescription.removedFields": "is_banned"},
+    ]}}]
+
+    def __init__(self, db):
+        self.db = db
+        self.poll_interval = getattr(Config, "BAN_POLL_INTERVAL", 60)
+        # Longest wait between attempts to reopen the change stream
+        self.max_backoff = getattr(Config, "BAN_STREAM_MAX_BACKOFF", 3600)
+        self.banned = set()
+        # Mongo _id -> user_id of banned users, so deletes can be applied
+        self.banned_ids = {}
+        self.task = None
+
+    @property
+    def collection(self):
+        database = getattr(self.db, "db", None)
+        return database["users"] if database is not None else None
+
+    def is_banned(self, user_id: int):
+        return user_id in self.banned
+
+    async def start(self):
+        """Load the ban list, then keep it fresh in the background"""
+        if self.collection is None:
+            return
+        await self.reload()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._follow())
+
+    async def reload(self):
+        """Replace the cache with the banned users in Mongo (served by the partial index)"""
+        try:
+            banned_ids = {}
+            async for user in self.collection.find({"is_banned": True}, {"user_id": 1}):
+                banned_ids[user["_id"]] = user.get("user_id")
+            self.banned_ids = banned_ids
+            self.banned = set(banned_ids.values())
+            logger.info(f"Loaded {len(self.banned)} banned users")
+        except Exception as e:
+            logger.error(f"Error loading banned users: {e}")
+
+    async def _follow(self):
+        backoff = self.poll_interval
+        while True:
+            try:
+                async with self.collection.watch(self.PIPELINE, full_document="updateLookup") as stream:
+                    logger.info("Following ban changes through a change stream")
+                    backoff = self.poll_interval
+                    async for change in stream:
+                        self._apply(change)
+            except OperationFailure as e:
+                # e.g. a standalone server, or a replica set still electing a primary
+                logger.warning(f"Change stream unavailable ({e}), polling bans for {backoff}s before retrying")
+            except PyMongoError as e:
+                logger.error(f"Ban change stream failed: {e}, polling bans for {backoff}s before retrying")
+            # Changes may be missed while the stream is down
+            await self._poll(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _poll(self, duration: float):
+        for _ in range(max(1, int(duration // self.poll_interval))):
+            await asyncio.sleep(self.poll_interval)
+            await self.reload()
+
+    def _apply(self, change: dict):
+        _id = change.get("documentKey", {}).get("_id")
+        if change["operationType"] == "delete":
+            user_id = self.banned_ids.pop(_id, None)
+            self.banned.discard(user_id)
+            return
+
+        user = change.get("fullDocument")
+        if not user:
+            return
+        if user.get("is_banned"):
+            self.banned_ids[_id] = user.get("user_id")
+            self.banned.add(user.get("user_id"))
+        else:
+            self.banned_ids.pop(_id, None)
+            self.banned.discard(user.get("user_id"))
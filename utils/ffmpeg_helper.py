@@ -1,19 +1,51 @@
 import asyncio
+import aiofiles
+import aiofiles.os
+import json
+import math
 import os
+import signal
 import subprocess
 import logging
+from utils.progress_manager import progress_manager
+from utils.subtitle_converter import SubtitleConverter
+from utils.job_registry import job_registry
 from config import Config
 
 logger = logging.getLogger(__name__)
 
 class FFmpegHelper:
+    # ffprobe results shared by all helpers, keyed by (path, size, mtime)
+    _probe_cache = {}
+    PROBE_CACHE_SIZE = 256
+    
+    # Codecs the MP4 muxer can stream-copy; anything else goes to MKV
+    MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'alac'}
+    MP4_SUBTITLE_CODECS = {'mov_text'}
+
     def __init__(self):
         self.ffmpeg = Config.FFMPEG_PATH
         self.ffprobe = Config.FFPROBE_PATH
+        self.subtitle_converter = SubtitleConverter()
+        # ffmpeg prints the actual error last; only this much of stderr is kept and logged
+        self.stderr_tail = getattr(Config, "FFMPEG_STDERR_TAIL", 4096)
+        # EBU R128 targets for loudness normalization
+        self.loudnorm_i = getattr(Config, "LOUDNORM_I", -16)
+        self.loudnorm_tp = getattr(Config, "LOUDNORM_TP", -1.5)
+        self.loudnorm_lra = getattr(Config, "LOUDNORM_LRA", 11)
     
-    async def merge_subtitle(self, video_path: str, subtitle_path: str, output_path: str, status_msg=None):
+    async def merge_subtitle(self, video_path: str, subtitle_path: str, output_path: str, status_msg=None,
+                             segment_time: float = None, on_segment=None):
         """Merge subtitle to video"""
+        normalized_path = None
         try:
+            # mov_text keeps no styling anyway, so hand ffmpeg clean UTF-8 SRT;
+            # this fixes cp1252/UTF-16 files without an extra ffmpeg run
+            if subtitle_path.rsplit(".", 1)[-1].lower() in ("srt", "vtt", "ass", "ssa"):
+                normalized_path = subtitle_path.rsplit(".", 1)[0] + "_utf8.srt"
+                if await self.subtitle_converter.convert(subtitle_path, normalized_path, "srt"):
+                    subtitle_path = normalized_path
+            
             # Build FFmpeg command
             cmd = [
                 self.ffmpeg,
@@ -26,35 +58,20 @@ class FFmpegHelper:
                 '-map', '0:a?',
                 '-map', '1:s',
                 '-metadata:s:s:0', 'language=eng',
-                '-y',
-                output_path
+                *self._output_args(output_path, segment_time)
             ]
             
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            # Run FFmpeg
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0:
-                logger.info("Subtitle merged successfully")
-                return True
-            else:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                if status_msg:
-                    await status_msg.edit_text(f"❌ Error: {stderr.decode()[:200]}")
-                return False
+            return await self._run(cmd, "Subtitle merged successfully", status_msg, on_segment)
         
         except Exception as e:
             logger.error(f"Error merging subtitle: {e}")
             if status_msg:
-                await status_msg.edit_text(f"❌ Error: {str(e)}")
+                await progress_manager.edit(status_msg, f"❌ Error: {str(e)}")
             return False
+        
+        finally:
+            if normalized_path and os.path.exists(normalized_path):
+                os.remove(normalized_path)
     
     async def extract_subtitle(self, video_path: str, output_path: str):
         """Extract subtitle from video"""
@@ -67,22 +84,7 @@ class FFmpegHelper:
                 output_path
             ]
             
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0:
-                logger.info("Subtitle extracted successfully")
-                return True
-            else:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                return False
+            return await self._run(cmd, "Subtitle extracted successfully")
         
         except Exception as e:
             logger.error(f"Error extracting subtitle: {e}")
@@ -114,8 +116,9 @@ class FFmpegHelper:
             logger.error(f"Error checking subtitles: {e}")
             return False
     
-    async def merge_audio(self, video_path: str, audio_path: str, output_path: str, status_msg=None):
-        """Merge audio to video"""
+    async def merge_audio(self, video_path: str, audio_path: str, output_path: str, status_msg=None,
+                          segment_time: float = None, on_segment=None, stream: dict = None, loudness: dict = None):
+        """Merge audio to video; with a loudness measurement, only stream is mapped and normalized"""
         try:
             cmd = [
                 self.ffmpeg,
@@ -123,72 +126,144 @@ class FFmpegHelper:
                 '-i', audio_path,
                 '-c:v', 'copy',
                 '-map', '0:v',
-                '-map', '1:a',
+                '-map', f'1:{stream["index"]}' if loudness else '1:a',
+                *self._loudnorm_args(stream, loudness),
                 '-shortest',
-                '-y',
-                output_path
+                *self._output_args(output_path, segment_time)
             ]
             
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            return await self._run(cmd, "Audio merged successfully", status_msg, on_segment)
+        
+        except Exception as e:
+            logger.error(f"Error merging audio: {e}")
+            if status_msg:
+                await progress_manager.edit(status_msg, f"❌ Error: {str(e)}")
+            return False
+    
+    async def audio_track_container(self, video_path: str, audio_path: str):
+        """Pick the output extension that can stream-copy every track"""
+        video_info = await self.probe(video_path)
+        audio_info = await self.probe(audio_path)
+        if not video_info or not audio_info:
+            return "mkv"
+        
+        format_name = video_info.get("format", {}).get("format_name", "")
+        if "mp4" not in format_name and "mov" not in format_name:
+            return "mkv"
+        
+        streams = video_info.get("streams", []) + [
+            s for s in audio_info.get("streams", []) if s.get("codec_type") == "audio"
+        ][:1]
+        for stream in streams:
+            codec = stream.get("codec_name")
+            if stream.get("codec_type") == "audio" and codec not in self.MP4_AUDIO_CODECS:
+                return "mkv"
+            if stream.get("codec_type") == "subtitle" and codec not in self.MP4_SUBTITLE_CODECS:
+                return "mkv"
+        return "mp4"
+    
+    async def add_audio_track(self, video_path: str, audio_path: str, output_path: str,
+                              offset: float = 0.0, language: str = None, status_msg=None,
+                              segment_time: float = None, on_segment=None):
+        """Add audio as an extra track, keeping existing tracks, without re-encoding"""
+        try:
+            info = await self.probe(video_path) or {}
+            streams = info.get("streams", [])
+            existing_audio = sum(1 for s in streams if s.get("codec_type") == "audio")
             
-            stdout, stderr = await process.communicate()
+            cmd = [self.ffmpeg, '-i', video_path]
+            if offset:
+                cmd += ['-itsoffset', f'{offset:.3f}']
+            cmd += [
+                '-i', audio_path,
+                '-map', '0:v',
+                '-map', '0:a?',
+                '-map', '0:s?',
+                '-map', '0:t?',
+                '-map', '1:a:0',
+                '-c', 'copy',
+                f'-disposition:a:{existing_audio}', 'default' if existing_audio == 0 else '0',
+            ]
+            if language:
+                cmd += [f'-metadata:s:a:{existing_audio}', f'language={language}']
+            if output_path.endswith('.mkv') and any(
+                s.get("codec_name") == "mov_text" for s in streams
+            ):
+                # mov_text only exists in MP4; Matroska needs a text codec it knows
+                cmd += ['-c:s', 'srt']
+            cmd += self._output_args(output_path, segment_time)
             
-            if process.returncode == 0:
-                logger.info("Audio merged successfully")
-                return True
-            else:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                if status_msg:
-                    await status_msg.edit_text(f"❌ Error: {stderr.decode()[:200]}")
-                return False
+            return await self._run(cmd, "Audio track added successfully", status_msg, on_segment)
         
         except Exception as e:
-            logger.error(f"Error merging audio: {e}")
+            logger.error(f"Error adding audio track: {e}")
             if status_msg:
-                await status_msg.edit_text(f"❌ Error: {str(e)}")
+                await progress_manager.edit(status_msg, f"❌ Error: {str(e)}")
             return False
     
-    async def extract_audio(self, video_path: str, output_path: str):
-        """Extract audio from video"""
+    async def remux_tracks(self, video_path: str, output_path: str, tracks: list, status_msg=None,
+                           segment_time: float = None, on_segment=None):
+        """Keep, reorder and retag audio/subtitle tracks in one stream-copy pass"""
         try:
             cmd = [
                 self.ffmpeg,
                 '-i', video_path,
+                '-map', '0:v?'
+            ]
+            for track in tracks:
+                cmd += ['-map', f'0:{track["index"]}']
+            if output_path.endswith('.mkv'):
+                cmd += ['-map', '0:t?']
+            cmd += ['-c', 'copy']
+            if output_path.endswith('.mkv') and any(
+                t['type'] == 'subtitle' and t.get('codec') == 'mov_text' for t in tracks
+            ):
+                # mov_text only exists in MP4; Matroska needs a text codec it knows
+                cmd += ['-c:s', 'srt']
+            
+            # Output stream specifiers count per type in the new order
+            positions = {'audio': 0, 'subtitle': 0}
+            for track in tracks:
+                spec = 'a' if track['type'] == 'audio' else 's'
+                n = positions[track['type']]
+                positions[track['type']] += 1
+                cmd += [
+                    f'-disposition:{spec}:{n}', 'default' if track['default'] else '0',
+                    f'-metadata:s:{spec}:{n}', f'language={track["language"]}'
+                ]
+            cmd += self._output_args(output_path, segment_time)
+            
+            return await self._run(cmd, "Tracks remuxed successfully", status_msg, on_segment)
+        
+        except Exception as e:
+            logger.error(f"Error remuxing tracks: {e}")
+            if status_msg:
+                await progress_manager.edit(status_msg, f"❌ Error: {str(e)}")
+            return False
+    
+    async def extract_audio(self, video_path: str, output_path: str, stream: dict = None, loudness: dict = None):
+        """Extract audio from video; with a loudness measurement, only stream is extracted and normalized"""
+        try:
+            cmd = [self.ffmpeg, '-i', video_path]
+            if loudness:
+                cmd += ['-map', f'0:{stream["index"]}']
+            cmd += [
                 '-vn',
                 '-acodec', 'libmp3lame',
                 '-q:a', '2',
+                *self._loudnorm_args(stream, loudness),
                 '-y',
                 output_path
             ]
             
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0:
-                logger.info("Audio extracted successfully")
-                return True
-            else:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                return False
+            return await self._run(cmd, "Audio extracted successfully")
         
         except Exception as e:
             logger.error(f"Error extracting audio: {e}")
             return False
     
-    async def remove_audio(self, video_path: str, output_path: str, status_msg=None):
+    async def remove_audio(self, video_path: str, output_path: str, status_msg=None,
+                           segment_time: float = None, on_segment=None):
         """Remove audio from video"""
         try:
             cmd = [
@@ -196,35 +271,212 @@ class FFmpegHelper:
                 '-i', video_path,
                 '-c:v', 'copy',
                 '-an',
-                '-y',
-                output_path
+                *self._output_args(output_path, segment_time)
             ]
             
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0:
-                logger.info("Audio removed successfully")
-                return True
-            else:
-                logger.error(f"FFmpeg error: {stderr.decode()}")
-                if status_msg:
-                    await status_msg.edit_text(f"❌ Error: {stderr.decode()[:200]}")
-                return False
+            return await self._run(cmd, "Audio removed successfully", status_msg, on_segment)
         
         except Exception as e:
             logger.error(f"Error removing audio: {e}")
             if status_msg:
-                await status_msg.edit_text(f"❌ Error: {str(e)}")
+                await progress_manager.edit(status_msg, f"❌ Error: {str(e)}")
+            return False
+    
+    def main_audio_stream(self, info: dict):
+        """The audio stream to measure and normalize: the one flagged default, else the first"""
+        streams = [s for s in (info or {}).get("streams", []) if s.get("codec_type") == "audio"]
+        for stream in streams:
+            if stream.get("disposition", {}).get("default"):
+                return stream
+        return streams[0] if streams else None
+    
+    async def measure_loudness(self, path: str, stream_index: int):
+        """First loudnorm pass: EBU R128 loudness of one audio stream, or None if it cannot be normalized"""
+        cmd = [
+            self.ffmpeg,
+            '-i', path,
+            '-map', f'0:{stream_index}',
+            '-af', f'loudnorm={self._loudnorm_targets()}:print_format=json',
+            '-f', 'null', '-'
+        ]
+        returncode, stderr = await self._execute(cmd)
+        if returncode != 0:
+            logger.error(f"Loudness measurement failed: {stderr.decode(errors='replace').strip()}")
+            return None
+        
+        # loudnorm prints its JSON summary last
+        text = stderr.decode(errors="replace")
+        try:
+            stats = json.loads(text[text.rindex("{"):text.rindex("}") + 1])
+            loudness = {key: float(stats[key]) for key in ("input_i", "input_tp", "input_lra", "input_thresh")}
+        except (ValueError, KeyError) as e:
+            logger.error(f"Could not read loudness measurement: {e}")
+            return None
+        
+        # Silence measures -inf and cannot be brought to a target
+        if not all(math.isfinite(value) for value in loudness.values()):
+            return None
+        return loudness
+    
+    def _loudnorm_targets(self):
+        return f"I={self.loudnorm_i}:TP={self.loudnorm_tp}:LRA={self.loudnorm_lra}"
+    
+    def _loudnorm_args(self, stream: dict, loudness: dict):
+        """Second loudnorm pass: one linear gain from a cached measurement, no dynamic compression"""
+        if not loudness:
+            return []
+        audio_filter = (
+            f"loudnorm={self._loudnorm_targets()}"
+            f":measured_I={loudness['input_i']}:measured_TP={loudness['input_tp']}"
+            f":measured_LRA={loudness['input_lra']}:measured_thresh={loudness['input_thresh']}"
+            ":linear=true"
+        )
+        # loudnorm resamples to 192 kHz; go back to the source rate (at most 48 kHz for MP3/AAC)
+        sample_rate = min(int(stream.get("sample_rate") or 48000), 48000)
+        return ['-af', audio_filter, '-ar', str(sample_rate)]
+    
+    async def _run(self, cmd: list, success_msg: str, status_msg=None, on_segment=None):
+        """Run an FFmpeg command, handing finished segments to on_segment as they appear"""
+        returncode, stderr = await self._execute(cmd, on_segment)
+        
+        if returncode == 0:
+            logger.info(success_msg)
+            return True
+        else:
+            error = stderr.decode(errors="replace").strip()
+            logger.error(f"FFmpeg error: {error}")
+            job_registry.fail()
+            if status_msg:
+                await progress_manager.edit(status_msg, f"❌ Error: {error[-200:]}")
             return False
     
+    async def _execute(self, cmd: list, on_segment=None):
+        """Run ffmpeg as a cancellable child of the current job; returns (returncode, stderr tail)"""
+        logger.info(f"Executing: {' '.join(cmd)}")
+        
+        segment_list = cmd[cmd.index('-segment_list') + 1] if '-segment_list' in cmd else None
+        # Machine-readable progress on stdout feeds the job watchdog
+        cmd = [cmd[0], '-nostats', '-progress', 'pipe:1', *cmd[1:]]
+        
+        # Own process group, so a cancel can kill ffmpeg and anything it spawned
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        
+        watcher = None
+        finished = asyncio.Event()
+        if segment_list and on_segment:
+            watcher = asyncio.create_task(self._watch_segments(segment_list, on_segment, finished))
+        
+        stderr_reader = asyncio.create_task(self._read_tail(process.stderr))
+        try:
+            with job_registry.stage("process"):
+                await self._read_progress(process.stdout)
+                await process.wait()
+            stderr = await stderr_reader
+        except asyncio.CancelledError:
+            self._kill(process)
+            stderr_reader.cancel()
+            await process.wait()
+            raise
+        finally:
+            finished.set()
+            if watcher:
+                await watcher
+            if segment_list and os.path.exists(segment_list):
+                os.remove(segment_list)
+        
+        return process.returncode, stderr
+    
+    async def _read_tail(self, stream):
+        """Drain a pipe so ffmpeg never blocks on it, keeping only the last stderr_tail bytes"""
+        tail = b""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                return tail
+            tail = (tail + chunk)[-self.stderr_tail:]
+    
+    async def _read_progress(self, stdout):
+        """Beat the job watchdog whenever ffmpeg's out_time moves forward"""
+        last_out_time = -1
+        async for line in stdout:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            if key != "out_time_us":
+                continue
+            try:
+                out_time = int(value)
+            except ValueError:
+                continue
+            if out_time > last_out_time:
+                last_out_time = out_time
+                job_registry.beat()
+    
+    def _kill(self, process):
+        """Kill an ffmpeg process group started by _execute"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        logger.info(f"Killed ffmpeg process group {process.pid}")
+    
+    def _output_args(self, output_path: str, segment_time: float = None):
+        """Output options: a single file, or keyframe-aligned parts of segment_time seconds"""
+        if not segment_time:
+            return ['-y', output_path]
+        
+        base, extension = output_path.rsplit(".", 1)
+        return [
+            '-f', 'segment',
+            '-segment_time', f'{segment_time:.3f}',
+            '-segment_format', 'matroska' if extension == 'mkv' else extension,
+            '-reset_timestamps', '1',
+            '-segment_list', self._segment_list(output_path),
+            '-segment_list_type', 'csv',
+            '-y', f'{base}_part%03d.{extension}'
+        ]
+    
+    def _segment_list(self, output_path: str):
+        return output_path + ".parts.csv"
+    
+    async def _watch_segments(self, segment_list: str, on_segment, finished: asyncio.Event):
+        """Poll the segment list; ffmpeg appends a line once a part is complete"""
+        directory = os.path.dirname(segment_list)
+        seen = 0
+        while True:
+            done = finished.is_set()
+            if await aiofiles.os.path.exists(segment_list):
+                async with aiofiles.open(segment_list) as f:
+                    entries = [line.split(",")[0] for line in (await f.read()).splitlines() if line]
+                for name in entries[seen:]:
+                    try:
+                        await on_segment(os.path.join(directory, name))
+                    except Exception as e:
+                        logger.error(f"Error handling segment {name}: {e}")
+                seen = len(entries)
+            if done:
+                return
+            await asyncio.sleep(1)
+    
+    def estimate_output_size(self, info: dict, keep=None, extra_bytes: int = 0):
+        """Estimate output bytes from a probe: input size minus dropped streams plus extra_bytes"""
+        fmt = (info or {}).get("format", {})
+        size = int(fmt.get("size", 0) or 0)
+        duration = float(fmt.get("duration", 0) or 0)
+        
+        dropped = 0
+        for stream in (info or {}).get("streams", []):
+            if keep is None or keep(stream):
+                continue
+            # Matroska keeps per-stream bitrates in the BPS tag
+            bit_rate = stream.get("bit_rate") or stream.get("tags", {}).get("BPS") or 0
+            dropped += int(bit_rate) * duration / 8
+        
+        return int(max(0, size - dropped) + extra_bytes)
+    
     async def get_video_info(self, video_path: str):
         """Get video information"""
         try:
@@ -257,3 +509,76 @@ class FFmpegHelper:
         except Exception as e:
             logger.error(f"Error getting video info: {e}")
             return None
+    
+    async def probe(self, path: str):
+        """Get format and stream information, cached per file"""
+        try:
+            stat = os.stat(path)
+            key = (path, stat.st_size, stat.st_mtime_ns)
+            if key in self._probe_cache:
+                return self._probe_cache[key]
+            
+            cmd = [
+                self.ffprobe,
+                '-v', 'error',
+                '-show_format',
+                '-show_streams',
+                '-of', 'json',
+                path
+            ]
+            
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await process.communicate()
+            
+            if process.returncode != 0:
+                logger.error(f"FFprobe error: {stderr.decode()[:500]}")
+                return None
+            
+            info = json.loads(stdout.decode())
+            if len(self._probe_cache) >= self.PROBE_CACHE_SIZE:
+                self._probe_cache.pop(next(iter(self._probe_cache)))
+            self._probe_cache[key] = info
+            return info
+        
+        except Exception as e:
+            logger.error(f"Error probing {path}: {e}")
+            return None
+    
+    async def extract_frame(self, video_path: str, timestamp: float):
+        """Grab a single frame as PNG bytes using a keyframe-only seek"""
+        try:
+            cmd = [
+                self.ffmpeg,
+                '-v', 'error',
+                '-skip_frame', 'nokey',
+                '-ss', f'{timestamp:.3f}',
+                '-i', video_path,
+                '-map', '0:v:0',
+                '-frames:v', '1',
+                '-f', 'image2pipe',
+                '-vcodec', 'png',
+                '-'
+            ]
+            
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            
+            stdout, stderr = await process.communicate()
+            
+            if process.returncode == 0 and stdout:
+                return stdout
+            else:
+                logger.error(f"FFmpeg error: {stderr.decode()[:500]}")
+                return None
+        
+        except Exception as e:
+            logger.error(f"Error extracting frame: {e}")
+            return None
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import shutil
+import time
+import logging
+from collections import OrderedDict
+from utils.job_registry import job_registry
+from utils.progress_manager import progress_manager
+from utils.async_files import remove_soon
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class InputCache:
+    """On-disk LRU of downloaded inputs keyed by file_unique_id, with single-flight downloads"""
+
+    def __init__(self):
+        self.cache_dir = getattr(
+            Config, "INPUT_CACHE_DIR", os.path.join(getattr(Config, "DOWNLOAD_DIR", "downloads"), "cache")
+        )
+        self.max_size = getattr(Config, "INPUT_CACHE_SIZE", 10 * 1024 * 1024 * 1024)
+
+        # file_unique_id -> {"path", "size", "refs"}, least recently used first
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.inflight = {}
+        self.waiters = {}
+        # file_unique_id -> (job, status_msg) of every caller waiting on its download
+        self.watchers = {}
+        self.total_size = 0
+        self.loaded = False
+
+    def _load(self):
+        """Adopt files left by a previous run, oldest first"""
+        self.loaded = True
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".deleting"):
+                # Evicted, but the process stopped before it was deleted
+                remove_soon(path)
+                continue
+            if name.endswith(".temp") or not os.path.isfile(path):
+                continue
+            files.append((os.path.getmtime(path), name, path))
+
+        for _, name, path in sorted(files):
+            self._add(os.path.splitext(name)[0], path)
+        self._evict()
+
+    def _add(self, key: str, path: str):
+        size = os.path.getsize(path)
+        self.entries[key] = {"path": path, "size": size, "refs": 0}
+        self.paths[path] = key
+        self.total_size += size
+
+    async def acquire(self, media, download, status_msg=None):
+        """Return a local path for media, downloading it at most once; pair with release()
+
+        download(on_progress) must call on_progress(current, total) as bytes arrive.
+        """
+        key = getattr(media, "file_unique_id", None)
+        if not key:
+            watchers = [(job_registry.current(), status_msg)]
+            start_time = time.time()
+            return await download(lambda current, total: self._report(watchers, current, total, start_time))
+
+        if not self.loaded:
+            self._load()
+
+        entry = self.entries.get(key)
+        if entry and os.path.exists(entry["path"]):
+            entry["refs"] += 1
+            self.entries.move_to_end(key)
+            job_registry.track_input(entry["path"], self.release)
+            logger.info(f"Input cache hit for {key}")
+            return entry["path"]
+        if entry:
+            self._remove(key)
+
+        # Concurrent requests share one download; shield it so one caller
+        # giving up does not cancel it for the others
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, media, download))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight download of {key}")
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        watcher = (job_registry.current(), status_msg)
+        self.watchers.setdefault(key, []).append(watcher)
+        try:
+            path = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # The last caller to give up stops the download
+                if self.waiters[key] == 1:
+                    task.cancel()
+            elif not task.cancelled() and task.result():
+                # Finished just as we gave up: drop the reference _fetch took for us
+                self.release(task.result())
+            raise
+        finally:
+            self.waiters[key] -= 1
+            if not self.waiters[key]:
+                del self.waiters[key]
+            # A caller that gave up gets no more beats or status edits
+            self.watchers[key].remove(watcher)
+            if not self.watchers[key]:
+                del self.watchers[key]
+        if not path:
+            return None
+
+        # _fetch already took a reference for every waiter
+        self.entries.move_to_end(key)
+        job_registry.track_input(path, self.release)
+        self._evict()
+        return path
+
+    async def _fetch(self, key: str, media, download):
+        start_time = time.time()
+        downloaded = await download(
+            lambda current, total: self._report(self.watchers.get(key, ()), current, total, start_time)
+        )
+        if not downloaded or not os.path.exists(downloaded):
+            return None
+
+        extension = os.path.splitext(getattr(media, "file_name", None) or downloaded)[1]
+        path = os.path.join(self.cache_dir, f"{key}{extension}")
+        try:
+            await asyncio.to_thread(shutil.move, downloaded, path)
+        except OSError as e:
+            logger.error(f"Error caching input: {e}")
+            return None
+
+        # One reference per caller waiting on this download, taken before any
+        # of them resumes, so a release() in between cannot evict the file
+        self._add(key, path)
+        self.entries[key]["refs"] = self.waiters.get(key, 0)
+        return path
+
+    @staticmethod
+    def _report(watchers, current, total, start_time):
+        """Download progress beats and updates every caller waiting on it, not just the one that started it"""
+        text = None
+        for job, status_msg in watchers:
+            if job is not None:
+                job_registry.beat(job)
+            if status_msg:
+                text = text or progress_manager.render(current, total, start_time, "⏬ Downloading")
+                progress_manager.update(status_msg, text)
+
+    def hold(self, path: str):
+        """Take a reference to an input a session kept across a restart; False if it is gone"""
+        if not self.loaded:
+            self._load()
+
+        key = self.paths.get(path)
+        if key is None:
+            return bool(path) and os.path.exists(path)
+        self.entries[key]["refs"] += 1
+        self.entries.move_to_end(key)
+        return True
+
+    def release(self, *paths):
+        """Drop a reference to each path; files outside the cache are deleted as before"""
+        for path in paths:
+            if not path:
+                continue
+
+            job_registry.untrack_input(path)
+            key = self.paths.get(path)
+            if key is None:
+                remove_soon(path)
+                continue
+
+            entry = self.entries[key]
+            entry["refs"] = max(0, entry["refs"] - 1)
+            self.entries.move_to_end(key)
+
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used files that no job holds until under max_size"""
+        for key in list(self.entries):
+            if self.total_size <= self.max_size:
+                break
+            if self.entries[key]["refs"] > 0:
+                continue
+            logger.info(f"Evicting {key} from input cache")
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.paths.pop(entry["path"], None)
+        self.total_size -= entry["size"]
+        # Renaming is instant and frees the name for a new download;
+        # the slow unlink of a large file happens off the loop
+        trash = entry["path"] + ".deleting"
+        try:
+            os.replace(entry["path"], trash)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f"Error removing cached input: {e}")
+            return
+        remove_soon(trash)
+
+
+input_cache = InputCache()
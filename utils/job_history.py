@@ -0,0 +1,128 @@
+import asyncio
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import OperationFailure
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobHistory:
+    """One compact record per finished job, batched into a TTL collection, with server-side analytics"""
+
+    STAGES = ("queue", "download", "process", "upload")
+
+    def __init__(self, db):
+        self.db = db
+        self.batch_size = getattr(Config, "JOB_HISTORY_BATCH_SIZE", 50)
+        self.flush_interval = getattr(Config, "JOB_HISTORY_FLUSH_INTERVAL", 10)
+        # Records kept while Mongo is unreachable, oldest dropped first
+        self.max_buffer = getattr(Config, "JOB_HISTORY_MAX_BUFFER", 5000)
+        self.buffer = []
+        self.flusher = None
+
+    @property
+    def collection(self):
+        database = getattr(self.db, "db", None)
+        return database["jobs"] if database is not None else None
+
+    def record(self, job):
+        """Job registry listener: queue a record of a finished job"""
+        if self.collection is None or not job.info.get("operation"):
+            return
+
+        now = time.monotonic()
+        stages = {name: round(seconds, 2) for name, seconds in job.stage_times.items()}
+        if job.started is not None:
+            stages["queue"] = round(job.started - job.created, 2)
+
+        self.buffer.append({
+            "created_at": datetime.now(timezone.utc),
+            "user_id": job.user_id,
+            "operation": job.info["operation"],
+            "step": job.info.get("step", 1),
+            "outcome": job.outcome,
+            "input_bytes": job.info.get("input_bytes", 0),
+            "output_bytes": job.output_bytes,
+            "duration": round(now - job.created, 2),
+            "stages": stages,
+        })
+        del self.buffer[:-self.max_buffer]
+
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """One insert_many per interval, or sooner once a full batch is waiting"""
+        while self.buffer:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self.buffer) < self.batch_size and time.monotonic() < deadline:
+                await asyncio.sleep(0.5)
+            await self.flush()
+            if self.buffer:
+                # Mongo refused the batch; back off before retrying
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        if not self.buffer or self.collection is None:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"Error writing job history: {e}")
+            self.buffer = (batch + self.buffer)[-self.max_buffer:]
+
+    async def analytics(self, days: int = 7):
+        """Per-operation and per-outcome summaries, aggregated on the server"""
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        match = {"$match": {"created_at": {"$gte": since}}}
+        # Only successful jobs count towards run times
+        ok_duration = {"$cond": [{"$eq": ["$outcome", "ok"]}, "$duration", None]}
+
+        group = {
+            "_id": {"operation": "$operation", "step": "$step"},
+            "jobs": {"$sum": 1},
+            "ok": {"$sum": {"$cond": [{"$eq": ["$outcome", "ok"]}, 1, 0]}},
+            "input_bytes": {"$sum": "$input_bytes"},
+            "output_bytes": {"$sum": "$output_bytes"},
+            "avg_duration": {"$avg": ok_duration},
+        }
+        for stage in self.STAGES:
+            group[stage] = {"$avg": f"$stages.{stage}"}
+
+        percentile_group = dict(group, percentiles={
+            "$percentile": {"input": ok_duration, "p": [0.5, 0.95], "method": "approximate"}
+        })
+        try:
+            operations = await self.collection.aggregate([
+                match, {"$group": percentile_group}, {"$sort": {"input_bytes": -1}}
+            ]).to_list(None)
+        except OperationFailure:
+            # $percentile needs MongoDB 7.0; fall back to one indexed sort/skip per operation
+            operations = await self.collection.aggregate([
+                match, {"$group": group}, {"$sort": {"input_bytes": -1}}
+            ]).to_list(None)
+            for operation in operations:
+                operation["percentiles"] = [
+                    await self._percentile(since, operation["_id"], operation["ok"], p) for p in (0.5, 0.95)
+                ]
+
+        outcomes = await self.collection.aggregate([
+            match,
+            {"$group": {"_id": "$outcome", "jobs": {"$sum": 1}}},
+            {"$sort": {"jobs": -1}},
+        ]).to_list(None)
+
+        return {"days": days, "operations": operations, "outcomes": outcomes}
+
+    async def _percentile(self, since, key: dict, count: int, p: float):
+        if not count:
+            return None
+        cursor = self.collection.find(
+            {"created_at": {"$gte": since}, "outcome": "ok", **key},
+            {"duration": 1}
+        ).sort("duration", 1).skip(int(p * (count - 1))).limit(1)
+        async for record in cursor:
+            return record["duration"]
+        return None
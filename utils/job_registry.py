@@ -0,0 +1,215 @@
+import asyncio
+import contextvars
+import glob
+import os
+import time
+import logging
+from contextlib import contextmanager
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.progress_manager import progress_manager
+from utils.async_files import remove
+
+logger = logging.getLogger(__name__)
+
+# The job the running code belongs to; tasks started inside a job inherit it
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+class Job:
+    """Everything a running job owns that has to go if it is cancelled"""
+
+    def __init__(self, user_id: int, max_duration: float = None, **info):
+        self.user_id = user_id
+        self.task = None
+        self.cancelled = False
+        self.reason = "❌ Cancelled!"
+        # What the job was and how it went, for the job history
+        self.info = info
+        self.outcome = None
+        self.failed = False
+        self.output_bytes = 0
+        self.stage_times = {}
+        self.created = time.monotonic()
+        # Set by the first beat(), i.e. once the job holds a slot
+        self.started = None
+        self.last_beat = None
+        self.max_duration = max_duration
+        self.patterns = set()
+        self.inputs = []
+        self.tasks = set()
+        self.status_msgs = {}
+
+class JobRegistry:
+    """Runs each job as a cancellable task and undoes its work when cancelled"""
+
+    CANCEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_job")]])
+
+    def __init__(self):
+        # user_id -> set of running jobs
+        self.jobs = {}
+        # Called with every finished job, e.g. to record it
+        self.listeners = []
+
+    def current(self):
+        return _current_job.get()
+
+    async def run(self, user_id: int, coro, max_duration: float = None, **info):
+        """Run coro as a job of user_id; returns its outcome ("ok", "failed", or why it was cancelled)"""
+        job = Job(user_id, max_duration, **info)
+
+        async def runner():
+            _current_job.set(job)
+            return await coro
+
+        # A task of its own, so cancelling never reaches pyrogram's worker
+        job.task = asyncio.create_task(runner())
+        self.jobs.setdefault(user_id, set()).add(job)
+        try:
+            await job.task
+            job.outcome = "failed" if job.failed else "ok"
+            return job.outcome
+        except asyncio.CancelledError:
+            if not job.cancelled:
+                job.outcome = "cancelled"
+                raise
+            return job.outcome
+        except Exception:
+            job.outcome = "error"
+            raise
+        finally:
+            self.jobs[user_id].discard(job)
+            if not self.jobs[user_id]:
+                del self.jobs[user_id]
+            if job.cancelled:
+                await self._cleanup(job)
+            else:
+                for status_msg in job.status_msgs.values():
+                    await progress_manager.drop_markup(status_msg)
+            for listener in self.listeners:
+                try:
+                    listener(job)
+                except Exception as e:
+                    logger.error(f"Job listener failed: {e}")
+
+    def has_jobs(self, user_id: int):
+        return bool(self.jobs.get(user_id))
+
+    def all_jobs(self):
+        return [job for jobs in self.jobs.values() for job in jobs]
+
+    def beat(self, job: Job = None):
+        """Record progress of a job, by default the current one (bytes moved, ffmpeg out_time advancing)"""
+        job = job or self.current()
+        if job is not None:
+            job.last_beat = time.monotonic()
+            if job.started is None:
+                job.started = job.last_beat
+
+    def cancel_job(self, job: Job, reason: str, outcome: str = "cancelled"):
+        """Cancel one job without waiting for it; its status messages show reason"""
+        if job.cancelled:
+            return
+        job.cancelled = True
+        job.reason = reason
+        job.outcome = outcome
+        job.task.cancel()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the block to the current job's stage timings"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            job = self.current()
+            if job is not None:
+                job.stage_times[name] = job.stage_times.get(name, 0) + time.monotonic() - start
+
+    def fail(self):
+        """Mark the current job as failed (download, ffmpeg or upload error)"""
+        job = self.current()
+        if job is not None:
+            job.failed = True
+
+    def add_output(self, size: int):
+        job = self.current()
+        if job is not None:
+            job.output_bytes += size
+
+    async def cancel(self, user_id: int):
+        """Cancel every running job of a user; returns how many there were"""
+        jobs = list(self.jobs.get(user_id, ()))
+        for job in jobs:
+            self.cancel_job(job, "❌ Cancelled!")
+        # Wait for them to unwind so their files are gone when we report back
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+        return len(jobs)
+
+    async def reply_status(self, message, text: str):
+        """Reply with a status message that carries a Cancel button while the job runs"""
+        status_msg = await message.reply_text(text, reply_markup=self.CANCEL_MARKUP)
+        self.track_status(status_msg)
+        return status_msg
+
+    def track_status(self, status_msg):
+        """Show the Cancel button on an existing status message while the job runs"""
+        job = self.current()
+        if job is None:
+            return
+        job.status_msgs[(status_msg.chat.id, status_msg.id)] = status_msg
+        progress_manager.keep_markup(status_msg, self.CANCEL_MARKUP)
+
+    def track_output(self, path: str):
+        """Remove path, its parts and thumbnails if the job is cancelled"""
+        job = self.current()
+        if job is not None:
+            base = os.path.splitext(path)[0]
+            job.patterns.add(glob.escape(base) + "*")
+
+    def track_task(self, task: asyncio.Task):
+        """Cancel a helper task (e.g. a part upload) along with the job"""
+        job = self.current()
+        if job is not None:
+            job.tasks.add(task)
+            task.add_done_callback(job.tasks.discard)
+
+    def track_input(self, path: str, release):
+        """Call release(path) if the job is cancelled before it gives the input back"""
+        job = self.current()
+        if job is not None:
+            job.inputs.append((path, release))
+
+    def untrack_input(self, path: str):
+        job = self.current()
+        if job is None:
+            return
+        for i, (tracked, _) in enumerate(job.inputs):
+            if tracked == path:
+                del job.inputs[i]
+                return
+
+    async def _cleanup(self, job: Job):
+        """Stop helper tasks, give back inputs and delete partial outputs"""
+        for task in list(job.tasks):
+            task.cancel()
+        await asyncio.gather(*job.tasks, return_exceptions=True)
+
+        for path, release in job.inputs:
+            try:
+                release(path)
+            except Exception as e:
+                logger.error(f"Error releasing {path}: {e}")
+
+        paths = await asyncio.to_thread(
+            lambda: [path for pattern in job.patterns for path in glob.glob(pattern)]
+        )
+        await remove(*paths)
+
+        for status_msg in job.status_msgs.values():
+            # An edit without markup also takes the Cancel button away
+            progress_manager.forget_markup(status_msg)
+            await progress_manager.edit(status_msg, job.reason)
+
+        logger.info(f"Cancelled a job of user {job.user_id}")
+
+
+job_registry = JobRegistry()
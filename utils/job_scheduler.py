@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+from contextlib import asynccontextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobScheduler:
+    """Shortest-job-first slots with a fast lane for small jobs and aging for large ones"""
+
+    # Relative cost per input byte: stream copies are bound by transfer and disk,
+    # encodes also keep a core busy for the whole duration
+    COST_FACTORS = {
+        "merge_subtitle": 1.0,
+        "extract_subtitle": 1.0,
+        "add_audio": 1.0,
+        "remove_audio": 1.0,
+        "edit_tracks": 1.0,
+        "merge_audio": 1.5,
+        "extract_audio": 1.5,
+    }
+
+    def __init__(self):
+        self.slots = getattr(Config, "MAX_CONCURRENT_JOBS", 4)
+        # Slots bulk jobs may never take, so small jobs always find one quickly
+        self.fast_slots = min(getattr(Config, "FAST_LANE_SLOTS", 1), self.slots - 1)
+        self.fast_max_cost = getattr(Config, "FAST_LANE_MAX_COST", 200 * 1024 * 1024)
+        # Cost a waiting job is forgiven per second, so large jobs never starve
+        self.aging_rate = getattr(Config, "SCHEDULER_AGING_RATE", 5 * 1024 * 1024)
+
+        self.queue = []
+        self.counter = itertools.count()
+        self.running = 0
+        self.running_bulk = 0
+
+    def cost(self, action: str, file_size: int):
+        """Estimated cost of a job from its operation and input size"""
+        return int((file_size or 0) * self.COST_FACTORS.get(action, 1.0))
+
+    def is_fast(self, cost: int):
+        return cost <= self.fast_max_cost
+
+    def has_free_slot(self, cost: int):
+        """Whether a job of this cost would start right away"""
+        if self.queue or self.running >= self.slots:
+            return False
+        return self.is_fast(cost) or self.running_bulk < self.slots - self.fast_slots
+
+    @asynccontextmanager
+    async def job(self, cost: int):
+        """Hold a slot for the duration of the block"""
+        fast = await self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(fast)
+
+    async def acquire(self, cost: int):
+        """Wait for a slot; returns True if the job runs in the fast lane"""
+        fast = self.is_fast(cost)
+        # Aging lowers every waiting job's cost at the same rate, so ordering by
+        # cost + rate * enqueue time is the same as ordering by aged cost
+        key = cost + self.aging_rate * time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (key, next(self.counter), fast, future))
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: hand the slot on
+                self.release(fast)
+            else:
+                self.queue = [entry for entry in self.queue if entry[3] is not future]
+                heapq.heapify(self.queue)
+            raise
+        return fast
+
+    def release(self, fast: bool):
+        self.running -= 1
+        if not fast:
+            self.running_bulk -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start the cheapest waiting jobs while slots are free"""
+        while self.queue and self.running < self.slots:
+            entry = self.queue[0]
+            if not entry[2] and self.running_bulk >= self.slots - self.fast_slots:
+                # Bulk lane is full: only a fast job may take the reserved slot
+                entry = min((e for e in self.queue if e[2]), default=None)
+                if entry is None:
+                    return
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+            else:
+                heapq.heappop(self.queue)
+
+            _, _, fast, future = entry
+            if future.done():
+                continue
+            self.running += 1
+            if not fast:
+                self.running_bulk += 1
+            future.set_result(True)
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import logging
+from utils.metrics import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class LoopMonitor:
+    """Logs the loop thread's stack whenever the event loop stops ticking for longer than a threshold"""
+
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, threshold: float = None, interval: float = None):
+        self.threshold = threshold if threshold is not None else getattr(Config, "LOOP_STALL_THRESHOLD_MS", 250) / 1000
+        self.interval = interval if interval is not None else getattr(Config, "LOOP_MONITOR_INTERVAL", 0.05)
+        self.loop_thread = None
+        self.heartbeat = time.monotonic()
+        self.stopped = threading.Event()
+        self.ticker = None
+        self.thread = None
+        # "file:line in function" -> {"count", "max_ms", "stack"}
+        self.stalls = {}
+
+    def start(self):
+        """Tick on the running loop and watch the ticks from a thread"""
+        if self.thread is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.ticker = asyncio.create_task(self._tick())
+        self.thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.ticker:
+            self.ticker.cancel()
+
+    async def _tick(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported = None
+        where = None
+        while not self.stopped.wait(self.threshold / 4):
+            beat = self.heartbeat
+            if reported is not None and beat != reported:
+                # The loop is ticking again; record how long the stall lasted
+                stall = self.stalls[where]
+                blocked_ms = round((beat - reported - self.interval) * 1000, 1)
+                stall["max_ms"] = max(stall["max_ms"], blocked_ms)
+                logger.warning(f"Event loop was blocked for {blocked_ms} ms at {where}")
+                reported = None
+            if reported is not None or time.monotonic() - beat < self.threshold + self.interval:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            if stack[-1].name == "select":
+                # Idle in the selector: the loop is waiting, not blocked
+                continue
+
+            # Attribute the stall to the innermost frame in the bot's own code
+            culprit = next(
+                (f for f in reversed(stack)
+                 if f.filename.startswith(self.ROOT) and "benchmarks" not in f.filename),
+                stack[-1]
+            )
+            where = f"{os.path.relpath(culprit.filename, self.ROOT)}:{culprit.lineno} in {culprit.name}"
+            stall = self.stalls.setdefault(where, {
+                "count": 0,
+                "max_ms": 0.0,
+                "stack": "".join(traceback.format_list(stack[-8:])),
+            })
+            stall["count"] += 1
+            metrics.incr("loop_stalls")
+            logger.warning(
+                f"Event loop blocked for over {int(self.threshold * 1000)} ms at {where}:\n{stall['stack']}"
+            )
+            reported = beat
+
+
+loop_monitor = LoopMonitor()
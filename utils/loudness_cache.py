@@ -0,0 +1,62 @@
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class LoudnessCache:
+    """Loudness measurements per input audio stream, keyed by file_unique_id and stream index"""
+
+    def __init__(self, db):
+        self.db = db
+        self.max_entries = getattr(Config, "LOUDNESS_CACHE_SIZE", 1024)
+        # "file_unique_id:stream_index" -> measurement, least recently used first
+        self.entries = OrderedDict()
+
+    @property
+    def collection(self):
+        # Measurements are tiny, so Mongo keeps them across restarts when it is there
+        database = getattr(self.db, "db", None)
+        return database["loudness"] if database is not None else None
+
+    @staticmethod
+    def key(media, stream_index: int):
+        file_unique_id = getattr(media, "file_unique_id", None)
+        return f"{file_unique_id}:{stream_index}" if file_unique_id else None
+
+    async def get(self, key: str):
+        if key is None:
+            return None
+
+        loudness = self.entries.get(key)
+        if loudness is not None:
+            self.entries.move_to_end(key)
+            return loudness
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": key})
+            except Exception as e:
+                logger.error(f"Error loading loudness of {key}: {e}")
+                return None
+            if doc:
+                self._remember(key, doc["loudness"])
+                return doc["loudness"]
+        return None
+
+    async def put(self, key: str, loudness: dict):
+        if key is None:
+            return
+
+        self._remember(key, loudness)
+        if self.collection is not None:
+            try:
+                await self.collection.update_one({"_id": key}, {"$set": {"loudness": loudness}}, upsert=True)
+            except Exception as e:
+                logger.error(f"Error saving loudness of {key}: {e}")
+
+    def _remember(self, key: str, loudness: dict):
+        self.entries[key] = loudness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
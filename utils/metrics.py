@@ -0,0 +1,20 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Metrics:
+    """Process-wide counters for operational events, e.g. watchdog kills"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        return {"uptime": int(time.time() - self.started), **self.counters}
+
+
+metrics = Metrics()
@@ -0,0 +1,241 @@
+import asyncio
+import aiofiles.os
+import glob
+import io
+import math
+import os
+import time
+import uuid
+import logging
+from PIL import Image
+from utils.ffmpeg_helper import FFmpegHelper
+from utils.file_helper import FileHelper
+from utils.progress_manager import progress_manager
+from utils.job_registry import job_registry
+from utils.async_files import remove_soon
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class OutputHelper:
+    """Output stage: gathers upload metadata and sends processed files"""
+
+    # Telegram rejects thumbnails larger than 320px on either side
+    THUMB_SIZE = (320, 320)
+
+    # Thumbnail path per output file, shared by all handlers
+    _thumb_cache = {}
+
+    # Parts are cut on keyframes, so aim below the limit to leave room for a long GOP
+    SPLIT_MARGIN = 0.9
+
+    def __init__(self):
+        self.ffmpeg = FFmpegHelper()
+        self.output_dir = getattr(Config, "DOWNLOAD_DIR", "downloads")
+
+    def job_path(self, input_path: str, suffix: str):
+        """Unique output path per job; cached inputs are shared, so outputs can't sit beside them"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        path = os.path.join(self.output_dir, f"{uuid.uuid4().hex[:8]}_{stem}{suffix}")
+        job_registry.track_output(path)
+        return path
+
+    async def get_video_metadata(self, video_path: str):
+        """Get duration, dimensions and thumbnail for a video upload"""
+        metadata = {"duration": 0, "width": 0, "height": 0, "thumb": None}
+
+        info = await self.ffmpeg.probe(video_path)
+        if not info:
+            return metadata
+
+        video = next(
+            (s for s in info.get("streams", []) if s.get("codec_type") == "video"
+             and not s.get("disposition", {}).get("attached_pic")),
+            None
+        )
+        duration = float(info.get("format", {}).get("duration", 0) or 0)
+        metadata["duration"] = int(duration)
+
+        if video:
+            width, height = int(video.get("width", 0)), int(video.get("height", 0))
+            # Swap dimensions for rotated phone recordings
+            if self._rotation(video) in (90, 270):
+                width, height = height, width
+            metadata["width"], metadata["height"] = width, height
+            metadata["thumb"] = await self.get_thumbnail(video_path, duration)
+
+        return metadata
+
+    def _rotation(self, video: dict):
+        """Rotation in degrees (0-359): display matrix side data on current ffprobe, else the old rotate tag"""
+        rotation = video.get("tags", {}).get("rotate", 0)
+        for side_data in video.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = side_data["rotation"]
+                break
+        try:
+            return int(float(rotation or 0)) % 360
+        except ValueError:
+            return 0
+
+    async def get_thumbnail(self, video_path: str, duration: float):
+        """Create a JPEG thumbnail from one keyframe, cached per output"""
+        cached = self._thumb_cache.get(video_path)
+        if cached and await aiofiles.os.path.exists(cached):
+            return cached
+
+        frame = await self.ffmpeg.extract_frame(video_path, duration * 0.1 if duration > 10 else 0)
+        if not frame:
+            return None
+
+        thumb_path = video_path.rsplit(".", 1)[0] + "_thumb.jpg"
+        try:
+            await asyncio.to_thread(self._write_thumbnail, frame, thumb_path)
+        except Exception as e:
+            logger.error(f"Error creating thumbnail: {e}")
+            return None
+
+        self._thumb_cache[video_path] = thumb_path
+        return thumb_path
+
+    def _write_thumbnail(self, frame: bytes, thumb_path: str):
+        with Image.open(io.BytesIO(frame)) as image:
+            image = image.convert("RGB")
+            image.thumbnail(self.THUMB_SIZE)
+            image.save(thumb_path, "JPEG", quality=85, optimize=True)
+
+    async def send_video(self, app, chat_id: int, video_path: str, caption: str, status_msg=None):
+        """Upload a video with duration, dimensions and thumbnail"""
+        metadata = await self.get_video_metadata(video_path)
+
+        return await self._upload(
+            app.send_video,
+            video_path,
+            chat_id=chat_id,
+            video=video_path,
+            caption=caption,
+            duration=metadata["duration"],
+            width=metadata["width"],
+            height=metadata["height"],
+            thumb=metadata["thumb"],
+            supports_streaming=True,
+            progress=self.progress,
+            progress_args=(status_msg, time.time())
+        )
+
+    async def send_audio(self, app, chat_id: int, audio_path: str, caption: str, status_msg=None):
+        """Upload an audio file"""
+        return await self._upload(
+            app.send_audio,
+            audio_path,
+            chat_id=chat_id,
+            audio=audio_path,
+            caption=caption,
+            progress=self.progress,
+            progress_args=(status_msg, time.time())
+        )
+
+    async def _upload(self, send, path: str, **kwargs):
+        """Send a file, recording upload time and output size for the job history"""
+        size = await aiofiles.os.path.getsize(path)
+        try:
+            with job_registry.stage("upload"):
+                message = await send(**kwargs)
+        except Exception:
+            job_registry.fail()
+            raise
+        job_registry.add_output(size)
+        return message
+
+    async def progress(self, current, total, status_msg, start_time, action="📤 Uploading"):
+        """Upload progress callback: feeds the job watchdog, and the status message if any"""
+        job_registry.beat()
+        if status_msg:
+            await progress_manager.progress(current, total, status_msg, start_time, action)
+
+    def split_time(self, estimated_size: int, duration: float):
+        """Seconds per part when an output would exceed the upload limit, else None"""
+        limit = getattr(Config, "MAX_UPLOAD_SIZE", Config.MAX_FILE_SIZE) * self.SPLIT_MARGIN
+        if estimated_size <= limit or duration <= 0:
+            return None
+        return duration / math.ceil(estimated_size / limit)
+
+    def plan_parts(self, app, chat_id: int, output_path: str, estimated_size: int, duration: float,
+                   caption: str, status_msg=None):
+        """Return a PartUploader when the output has to be split, else None"""
+        segment_time = self.split_time(estimated_size, duration)
+        if not segment_time:
+            return None
+
+        logger.info(
+            f"Splitting {output_path}: ~{estimated_size} bytes into parts of {segment_time:.1f}s"
+        )
+        return PartUploader(self, app, chat_id, output_path, segment_time, caption, status_msg)
+
+    def cleanup(self, video_path: str):
+        """Remove the cached thumbnail of an output"""
+        thumb_path = self._thumb_cache.pop(video_path, None)
+        if thumb_path:
+            remove_soon(thumb_path)
+
+
+class PartUploader:
+    """Uploads the parts of a split output concurrently, as soon as ffmpeg closes each one"""
+
+    def __init__(self, output: OutputHelper, app, chat_id: int, output_path: str, segment_time: float,
+                 caption: str, status_msg=None):
+        self.output = output
+        self.app = app
+        self.chat_id = chat_id
+        self.output_path = output_path
+        self.segment_time = segment_time
+        self.caption = caption
+        self.status_msg = status_msg
+        self.file_helper = FileHelper()
+        self.tasks = []
+        self.uploaded = 0
+
+    async def add(self, part_path: str):
+        """Segment callback: start uploading a finished part"""
+        number = len(self.tasks) + 1
+        task = asyncio.create_task(self._upload(number, part_path))
+        job_registry.track_task(task)
+        self.tasks.append(task)
+
+    async def _upload(self, number: int, part_path: str):
+        await self.output.send_video(
+            self.app,
+            self.chat_id,
+            part_path,
+            f"{self.caption}\n\n"
+            f"📦 Part {number}\n"
+            f"📁 File size: {self.file_helper.format_size(await aiofiles.os.path.getsize(part_path))}\n"
+            f"⚡ Processed by @YourBotUsername"
+        )
+        self.uploaded += 1
+        if self.status_msg:
+            progress_manager.update(self.status_msg, f"📤 Uploaded {self.uploaded} of {len(self.tasks)} parts...")
+
+    async def finish(self):
+        """Wait for every part to upload; returns the part count or raises the first error"""
+        if not self.tasks:
+            raise RuntimeError("No parts were produced")
+        try:
+            await asyncio.gather(*self.tasks)
+        except Exception:
+            self.abort()
+            raise
+        return len(self.tasks)
+
+    def abort(self):
+        """Cancel uploads still in flight"""
+        for task in self.tasks:
+            task.cancel()
+
+    def cleanup(self):
+        """Remove every part on disk, uploaded or not, and their thumbnails"""
+        base, extension = self.output_path.rsplit(".", 1)
+        for path in glob.glob(f"{glob.escape(base)}_part*.{extension}"):
+            self.output.cleanup(path)
+            remove_soon(path)
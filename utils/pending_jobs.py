@@ -0,0 +1,77 @@
+import copy
+import time
+import logging
+from pyrogram.types import Message
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class PendingJobs:
+    """Queued jobs and open sessions handed from a draining process to the next one"""
+
+    def __init__(self, db):
+        self.db = db
+        # Saved work older than this is not resumed
+        self.max_age = getattr(Config, "PENDING_JOB_MAX_AGE", 3600)
+
+    @property
+    def collection(self):
+        database = getattr(self.db, "db", None)
+        return database["pending_jobs"] if database is not None else None
+
+    @staticmethod
+    def snapshot(session: dict):
+        """Copy of a session that can be stored; messages are kept as (chat_id, message_id)"""
+        doc = {}
+        for key, value in session.items():
+            if isinstance(value, Message):
+                doc[key] = {"_message": [value.chat.id, value.id]}
+            else:
+                doc[key] = copy.deepcopy(value)
+        return doc
+
+    @staticmethod
+    async def restore(app, doc: dict):
+        """Session from a snapshot, with its messages fetched again"""
+        session = {}
+        for key, value in doc.items():
+            if isinstance(value, dict) and "_message" in value:
+                chat_id, message_id = value["_message"]
+                value = await app.get_messages(chat_id, message_id)
+                if value is None or value.empty:
+                    raise ValueError(f"message {message_id} in {chat_id} is gone")
+            session[key] = value
+        return session
+
+    async def save(self, entries: list):
+        """Replace the saved work with entries ({"user_id", "kind", "session", ...})"""
+        if self.collection is None:
+            if entries:
+                logger.warning(f"No database, {len(entries)} pending jobs are lost")
+            return
+        try:
+            await self.collection.delete_many({})
+            for entry in entries:
+                entry["saved_at"] = time.time()
+            if entries:
+                await self.collection.insert_many(entries, ordered=False)
+            logger.info(f"Saved {len(entries)} pending jobs")
+        except Exception as e:
+            logger.error(f"Error saving pending jobs: {e}")
+
+    async def take(self):
+        """Saved work in the order it was saved, removed so it is resumed only once"""
+        if self.collection is None:
+            return []
+        try:
+            entries = await self.collection.find({}).sort("_id", 1).to_list(None)
+            await self.collection.delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+        except Exception as e:
+            logger.error(f"Error loading pending jobs: {e}")
+            return []
+
+        cutoff = time.time() - self.max_age
+        stale = [entry for entry in entries if entry.get("saved_at", 0) < cutoff]
+        if stale:
+            logger.warning(f"Dropping {len(stale)} pending jobs older than {self.max_age}s")
+        return [entry for entry in entries if entry.get("saved_at", 0) >= cutoff]
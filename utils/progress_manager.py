@@ -0,0 +1,197 @@
+import asyncio
+import time
+import logging
+from pyrogram.errors import FloodWait, MessageNotModified
+from utils.file_helper import FileHelper
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ProgressManager:
+    """Owns status message edits: coalesces, rate-limits and deduplicates them"""
+
+    def __init__(self):
+        self.min_interval = getattr(Config, "PROGRESS_MIN_INTERVAL", 5)
+        self.edits_per_second = getattr(Config, "PROGRESS_EDITS_PER_SECOND", 20)
+        self.file_helper = FileHelper()
+
+        # Latest unsent update per message, keyed by (chat_id, message_id)
+        self.pending = {}
+        # Bumped by every update/edit of a message, so a late send can tell it is stale
+        self.seq = {}
+        # Flusher edit in flight per message, awaited before a final edit()
+        self.sending = {}
+        self.last_text = {}
+        self.last_edit = {}
+        # Markup kept on a message across edits (e.g. a Cancel button), and the one last sent
+        self.markups = {}
+        self.last_markup = {}
+
+        self.tokens = float(self.edits_per_second)
+        self.tokens_updated = time.monotonic()
+        self.flood_until = 0
+        self.flusher = None
+
+    @staticmethod
+    def _key(status_msg):
+        return (status_msg.chat.id, status_msg.id)
+
+    def update(self, status_msg, text: str, reply_markup=None):
+        """Queue a status update, replacing any unsent one for the same message"""
+        key = self._key(status_msg)
+        seq = self._bump(key)
+        if self.last_text.get(key) == text:
+            self.pending.pop(key, None)
+            return
+
+        self.pending[key] = (status_msg, text, reply_markup or self.markups.get(key), seq)
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def edit(self, status_msg, text: str, reply_markup=None):
+        """Edit a status message now, superseding any queued update"""
+        key = self._key(status_msg)
+        seq = self._bump(key)
+        self.pending.pop(key, None)
+        # Let a progress edit already on its way land first, so it cannot overwrite this one
+        sending = self.sending.get(key)
+        if sending is not None:
+            await asyncio.wait({sending})
+        if self.last_text.get(key) == text:
+            return
+
+        await self._acquire()
+        await self._send(key, status_msg, text, reply_markup or self.markups.get(key), seq)
+
+    def _bump(self, key):
+        self.seq[key] = self.seq.get(key, 0) + 1
+        return self.seq[key]
+
+    def keep_markup(self, status_msg, reply_markup):
+        """Send reply_markup with every edit that does not bring its own"""
+        key = self._key(status_msg)
+        self.markups[key] = reply_markup
+        self.last_markup[key] = reply_markup
+
+    def forget_markup(self, status_msg):
+        """Stop attaching the kept markup; returns it"""
+        return self.markups.pop(self._key(status_msg), None)
+
+    async def drop_markup(self, status_msg):
+        """Stop attaching the kept markup and take it off the message if it is still shown"""
+        key = self._key(status_msg)
+        markup = self.forget_markup(status_msg)
+        if markup is None:
+            return
+
+        if key in self.pending:
+            pending_msg, text, reply_markup, seq = self.pending[key]
+            if reply_markup is markup:
+                self.pending[key] = (pending_msg, text, None, seq)
+            return
+
+        if self.last_markup.get(key) is markup:
+            await self._acquire()
+            try:
+                await status_msg.edit_reply_markup(None)
+                self.last_markup[key] = None
+            except MessageNotModified:
+                self.last_markup[key] = None
+            except Exception as e:
+                logger.error(f"Status markup removal failed: {e}")
+
+    async def progress(self, current, total, status_msg, start_time, action="📤 Uploading"):
+        """Pyrogram progress callback: renders text only, never calls the API"""
+        self.update(status_msg, self.render(current, total, start_time, action))
+
+    def render(self, current, total, start_time, action):
+        """Render a progress status text"""
+        elapsed = time.time() - start_time
+        speed = current / elapsed if elapsed > 0 else 0
+        percent = int(current * 100 / total) if total else 0
+        filled = percent // 10
+        eta = int((total - current) / speed) if speed > 0 else 0
+
+        return (
+            f"{action}...\n\n"
+            f"[{'█' * filled}{'░' * (10 - filled)}] {percent}%\n"
+            f"📁 {self.file_helper.format_size(current)} / {self.file_helper.format_size(total)}\n"
+            f"⚡ Speed: {self.file_helper.format_size(speed)}/s\n"
+            f"⏱ ETA: {eta // 60}m {eta % 60}s"
+        )
+
+    async def _flush_loop(self):
+        """Send due updates, oldest edited message first"""
+        while self.pending:
+            now = time.monotonic()
+            due = [
+                key for key in self.pending
+                if now - self.last_edit.get(key, 0) >= self.min_interval
+            ]
+            if not due:
+                await asyncio.sleep(0.5)
+                continue
+
+            due.sort(key=lambda key: self.last_edit.get(key, 0))
+            for key in due:
+                await self._acquire()
+                if key not in self.pending:
+                    continue
+                status_msg, text, reply_markup, seq = self.pending.pop(key)
+                task = asyncio.create_task(self._send(key, status_msg, text, reply_markup, seq))
+                self.sending[key] = task
+                task.add_done_callback(
+                    lambda task, key=key: self.sending.pop(key) if self.sending.get(key) is task else None
+                )
+
+        self._prune()
+
+    async def _acquire(self):
+        """Take one edit from the global budget, waiting out any FloodWait"""
+        while True:
+            now = time.monotonic()
+            if now < self.flood_until:
+                await asyncio.sleep(self.flood_until - now)
+                continue
+
+            self.tokens = min(
+                self.edits_per_second,
+                self.tokens + (now - self.tokens_updated) * self.edits_per_second
+            )
+            self.tokens_updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.edits_per_second)
+
+    async def _send(self, key, status_msg, text, reply_markup, seq):
+        self.last_edit[key] = time.monotonic()
+        try:
+            await status_msg.edit_text(text, reply_markup=reply_markup)
+            self.last_text[key] = text
+            self.last_markup[key] = reply_markup
+        except MessageNotModified:
+            self.last_text[key] = text
+        except FloodWait as e:
+            logger.warning(f"FloodWait of {e.value}s on status edit, pausing all edits")
+            self.flood_until = time.monotonic() + e.value
+            # Retry only if nothing newer was queued or sent for this message meanwhile
+            if self.seq.get(key) == seq:
+                self.pending[key] = (status_msg, text, reply_markup, seq)
+                if self.flusher is None or self.flusher.done():
+                    self.flusher = asyncio.create_task(self._flush_loop())
+        except Exception as e:
+            logger.error(f"Status edit failed: {e}")
+
+    def _prune(self):
+        """Forget messages that have not been edited for a while"""
+        cutoff = time.monotonic() - 600
+        for key in [key for key, at in self.last_edit.items() if at < cutoff]:
+            self.last_edit.pop(key, None)
+            self.last_text.pop(key, None)
+            self.last_markup.pop(key, None)
+            if key not in self.pending and key not in self.sending:
+                self.seq.pop(key, None)
+
+
+progress_manager = ProgressManager()
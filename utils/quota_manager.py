@@ -0,0 +1,173 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class QuotaManager:
+    """Per-user concurrency, daily bytes and hourly job limits, cached in memory and synced to Mongo"""
+
+    # None means unlimited
+    DEFAULT_TIERS = {
+        "free": {"concurrent_jobs": 1, "bytes_per_day": 20 * 1024 ** 3, "jobs_per_hour": 30},
+        "premium": {"concurrent_jobs": 3, "bytes_per_day": 200 * 1024 ** 3, "jobs_per_hour": 200},
+        "admin": {"concurrent_jobs": None, "bytes_per_day": None, "jobs_per_hour": None},
+    }
+
+    def __init__(self, db):
+        self.db = db
+        self.tiers = getattr(Config, "USER_TIERS", self.DEFAULT_TIERS)
+        self.premium_users = set(getattr(Config, "PREMIUM_USERS", []))
+        self.sync_interval = getattr(Config, "QUOTA_SYNC_INTERVAL", 30)
+
+        # user_id -> {"active", "day", "bytes", "jobs"}
+        self.usage = {}
+        # Day the counters were last rolled over, to prune users idle since an earlier day
+        self.day = self.today()
+        self.dirty = set()
+        self.locks = {}
+        self.syncer = None
+
+    @property
+    def collection(self):
+        # Database keeps its motor database handle on .db; counters stay in memory without it
+        database = getattr(self.db, "db", None)
+        return database["usage"] if database is not None else None
+
+    def tier(self, user_id: int):
+        if user_id in Config.ADMIN_IDS:
+            return "admin"
+        if user_id in self.premium_users:
+            return "premium"
+        return "free"
+
+    async def _get(self, user_id: int):
+        """Cached usage of a user, loaded from Mongo on first use"""
+        usage = self.usage.get(user_id)
+        if usage is not None:
+            return usage
+
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            if user_id in self.usage:
+                return self.usage[user_id]
+
+            usage = {"active": 0, "day": self.today(), "bytes": 0, "jobs": deque()}
+            if self.collection is not None:
+                try:
+                    doc = await self.collection.find_one({"_id": user_id})
+                    if doc and doc.get("day") == usage["day"]:
+                        usage["bytes"] = doc.get("bytes", 0)
+                    if doc:
+                        cutoff = time.time() - 3600
+                        usage["jobs"] = deque(t for t in doc.get("jobs", []) if t > cutoff)
+                except Exception as e:
+                    logger.error(f"Error loading usage for {user_id}: {e}")
+
+            self.usage[user_id] = usage
+            self.locks.pop(user_id, None)
+            return usage
+
+    @staticmethod
+    def today():
+        """The day daily bytes are counted for, as used by check() and finish()"""
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    async def check(self, user_id: int, file_size: int, new_job: bool = True):
+        """Reserve a slot and the bytes for a job; returns an error message if a limit is hit"""
+        limits = self.tiers.get(self.tier(user_id), self.tiers.get("free", {}))
+        if self.day != self.today():
+            self._prune()
+        usage = await self._get(user_id)
+
+        now = time.time()
+        if usage["day"] != self.today():
+            usage["day"], usage["bytes"] = self.today(), 0
+        while usage["jobs"] and usage["jobs"][0] <= now - 3600:
+            usage["jobs"].popleft()
+
+        concurrent_jobs = limits.get("concurrent_jobs")
+        if concurrent_jobs is not None and usage["active"] >= concurrent_jobs:
+            return (
+                f"⚠️ You already have {usage['active']} job(s) running.\n"
+                f"Please wait for them to finish first."
+            )
+
+        jobs_per_hour = limits.get("jobs_per_hour")
+        if new_job and jobs_per_hour is not None and len(usage["jobs"]) >= jobs_per_hour:
+            minutes = int((usage["jobs"][0] + 3600 - now) // 60) + 1
+            return f"⚠️ Hourly limit of {jobs_per_hour} jobs reached.\nTry again in {minutes} min."
+
+        bytes_per_day = limits.get("bytes_per_day")
+        if bytes_per_day is not None and usage["bytes"] + file_size > bytes_per_day:
+            return (
+                f"⚠️ Daily limit of {bytes_per_day / 1024 ** 3:.0f} GB reached.\n"
+                f"It resets at 00:00 UTC."
+            )
+
+        usage["active"] += 1
+        usage["bytes"] += file_size
+        if new_job:
+            usage["jobs"].append(now)
+        self._mark_dirty(user_id)
+        return None
+
+    def finish(self, user_id: int, refund: int = 0, day: str = None):
+        """Give back the concurrency slot taken by check(), and refund bytes charged on day"""
+        usage = self.usage.get(user_id)
+        if usage:
+            usage["active"] = max(0, usage["active"] - 1)
+            if refund and usage["day"] == day:
+                usage["bytes"] = max(0, usage["bytes"] - refund)
+                self._mark_dirty(user_id)
+
+    def _prune(self):
+        """Forget users whose counters are from an earlier day and who have nothing left to count"""
+        self.day = self.today()
+        cutoff = time.time() - 3600
+        for user_id in [
+            user_id for user_id, usage in self.usage.items()
+            if usage["day"] != self.day and not usage["active"] and user_id not in self.dirty
+            and not any(t > cutoff for t in usage["jobs"])
+        ]:
+            del self.usage[user_id]
+
+    def _mark_dirty(self, user_id: int):
+        if self.collection is None:
+            return
+        self.dirty.add(user_id)
+        if self.syncer is None or self.syncer.done():
+            self.syncer = asyncio.create_task(self._sync_loop())
+
+    async def _sync_loop(self):
+        """Write changed counters back in one bulk write per interval"""
+        while self.dirty:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def sync(self):
+        if not self.dirty or self.collection is None:
+            return
+
+        user_ids, self.dirty = self.dirty, set()
+        requests = [
+            UpdateOne(
+                {"_id": user_id},
+                {"$set": {
+                    "day": self.usage[user_id]["day"],
+                    "bytes": self.usage[user_id]["bytes"],
+                    "jobs": list(self.usage[user_id]["jobs"]),
+                }},
+                upsert=True
+            )
+            for user_id in user_ids if user_id in self.usage
+        ]
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.error(f"Error syncing usage: {e}")
+            self.dirty |= user_ids
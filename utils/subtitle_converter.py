@@ -0,0 +1,225 @@
+import asyncio
+import codecs
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SubtitleConverter:
+    """Pure-Python SRT/VTT/ASS conversion, encoding repair and time shifting"""
+
+    FORMATS = ("srt", "vtt", "ass")
+
+    # 00:01:02,345 (SRT), 00:01:02.345 or 01:02.345 (VTT)
+    TIMESTAMP = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})")
+    ASS_TAG = re.compile(r"\{[^}]*\}")
+    # Voice, class and karaoke timestamp tags only VTT understands
+    VTT_TAG = re.compile(r"</?(?:c|v|lang|ruby|rt)(?:[.\s][^>]*)?>|<\d[\d:.]*>")
+
+    ASS_HEADER = (
+        "[Script Info]\n"
+        "ScriptType: v4.00+\n"
+        "PlayResX: 384\n"
+        "PlayResY: 288\n"
+        "WrapStyle: 0\n"
+        "\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+        "Style: Default,Arial,16,&Hffffff,&Hffffff,&H0,&H0,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,0\n"
+        "\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+
+    def detect_encoding(self, path: str):
+        """Detect UTF-8/UTF-16 (with or without BOM), falling back to cp1252"""
+        with open(path, "rb") as f:
+            head = f.read(64 * 1024)
+
+        if head.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return "utf-16"
+
+        # UTF-16 without BOM: every other byte of ASCII text is NUL
+        if head and head.count(b"\x00") > len(head) // 4:
+            return "utf-16-le" if head[1:2] == b"\x00" else "utf-16-be"
+
+        try:
+            head.decode("utf-8")
+            return "utf-8"
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the sample is still UTF-8
+            if e.start >= len(head) - 3:
+                return "utf-8"
+            return "cp1252"
+
+    def detect_format(self, path: str, encoding: str):
+        """Guess the format from the content, then from the extension"""
+        with open(path, encoding=encoding, errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("WEBVTT"):
+                    return "vtt"
+                if line.startswith("[Script Info]") or line.startswith("[Events]"):
+                    return "ass"
+                break
+
+        extension = os.path.splitext(path)[1].lower().lstrip(".")
+        if extension in ("ass", "ssa"):
+            return "ass"
+        return extension if extension in self.FORMATS else "srt"
+
+    def read_cues(self, path: str, fmt: str = None):
+        """Yield (start_ms, end_ms, text) cues one at a time"""
+        encoding = self.detect_encoding(path)
+        fmt = fmt or self.detect_format(path, encoding)
+
+        with open(path, encoding=encoding, errors="replace", newline=None) as f:
+            if fmt == "ass":
+                yield from self._read_ass(f)
+            else:
+                yield from self._read_blocks(f)
+
+    def _read_blocks(self, lines):
+        """SRT and VTT: blank-line separated blocks with a "-->" timing line"""
+        block = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if line.strip():
+                block.append(line)
+                continue
+            cue = self._parse_block(block)
+            if cue:
+                yield cue
+            block = []
+
+        cue = self._parse_block(block)
+        if cue:
+            yield cue
+
+    def _parse_block(self, block):
+        for i, line in enumerate(block):
+            if "-->" not in line:
+                continue
+            start, _, end = line.partition("-->")
+            start_ms = self._parse_timestamp(start)
+            # VTT cue settings may follow the end time
+            end_ms = self._parse_timestamp(end.strip().split(" ")[0])
+            if start_ms is None or end_ms is None:
+                return None
+            return (start_ms, end_ms, self.VTT_TAG.sub("", "\n".join(block[i + 1:])))
+        return None
+
+    def _parse_timestamp(self, value: str):
+        match = self.TIMESTAMP.search(value)
+        if not match:
+            return None
+        hours, minutes, seconds, fraction = match.groups()
+        return (
+            int(hours or 0) * 3600000 + int(minutes) * 60000 + int(seconds) * 1000
+            + int(fraction.ljust(3, "0"))
+        )
+
+    def _read_ass(self, lines):
+        """ASS/SSA: Dialogue lines of the [Events] section"""
+        fields = None
+        in_events = False
+        for line in lines:
+            line = line.strip()
+            if line.startswith("["):
+                in_events = line.lower() == "[events]"
+                continue
+            if not in_events:
+                continue
+            if line.startswith("Format:"):
+                fields = [name.strip().lower() for name in line[7:].split(",")]
+            elif line.startswith("Dialogue:") and fields:
+                values = line[9:].strip().split(",", len(fields) - 1)
+                if len(values) != len(fields):
+                    continue
+                event = dict(zip(fields, values))
+                start_ms = self._parse_ass_timestamp(event.get("start", ""))
+                end_ms = self._parse_ass_timestamp(event.get("end", ""))
+                if start_ms is None or end_ms is None:
+                    continue
+                yield (start_ms, end_ms, self._ass_to_text(event.get("text", "")))
+
+    def _parse_ass_timestamp(self, value: str):
+        # h:mm:ss.cc
+        try:
+            hours, minutes, seconds = value.strip().split(":")
+            return int(hours) * 3600000 + int(minutes) * 60000 + round(float(seconds) * 1000)
+        except ValueError:
+            return None
+
+    def _ass_to_text(self, text: str):
+        """Keep italic/bold/underline, drop every other override tag"""
+        for tag, html in (("i", "i"), ("b", "b"), ("u", "u")):
+            text = text.replace(f"{{\\{tag}1}}", f"<{html}>").replace(f"{{\\{tag}0}}", f"</{html}>")
+        text = self.ASS_TAG.sub("", text)
+        return text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+
+    def _text_to_ass(self, text: str):
+        for tag in ("i", "b", "u"):
+            text = text.replace(f"<{tag}>", f"{{\\{tag}1}}").replace(f"</{tag}>", f"{{\\{tag}0}}")
+        text = re.sub(r"<[^>]+>", "", text)
+        return text.replace("\n", "\\N")
+
+    def shift_cues(self, cues, shift_ms: int):
+        """Move cues by shift_ms, dropping any that end before zero"""
+        for start_ms, end_ms, text in cues:
+            start_ms, end_ms = start_ms + shift_ms, end_ms + shift_ms
+            if end_ms <= 0:
+                continue
+            yield (max(0, start_ms), end_ms, text)
+
+    def write_cues(self, cues, path: str, fmt: str):
+        """Write cues as UTF-8 in the given format, one at a time"""
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            if fmt == "vtt":
+                f.write("WEBVTT\n\n")
+            elif fmt == "ass":
+                f.write(self.ASS_HEADER)
+
+            for i, (start_ms, end_ms, text) in enumerate(cues, 1):
+                if fmt == "srt":
+                    f.write(f"{i}\n{self._format_timestamp(start_ms, ',')} --> "
+                            f"{self._format_timestamp(end_ms, ',')}\n{text}\n\n")
+                elif fmt == "vtt":
+                    f.write(f"{self._format_timestamp(start_ms, '.')} --> "
+                            f"{self._format_timestamp(end_ms, '.')}\n{text}\n\n")
+                else:
+                    f.write(f"Dialogue: 0,{self._format_ass_timestamp(start_ms)},"
+                            f"{self._format_ass_timestamp(end_ms)},Default,,0,0,0,,{self._text_to_ass(text)}\n")
+
+    def _format_timestamp(self, ms: int, separator: str):
+        return f"{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02}{separator}{ms % 1000:03}"
+
+    def _format_ass_timestamp(self, ms: int):
+        return f"{ms // 3600000}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02}.{ms % 1000 // 10:02}"
+
+    def convert_file(self, input_path: str, output_path: str, fmt: str = None, shift_ms: int = 0):
+        """Convert a subtitle file to UTF-8 SRT/VTT/ASS, optionally shifting it"""
+        fmt = fmt or os.path.splitext(output_path)[1].lower().lstrip(".")
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported subtitle format: {fmt}")
+
+        cues = self.read_cues(input_path)
+        if shift_ms:
+            cues = self.shift_cues(cues, shift_ms)
+        self.write_cues(cues, output_path, fmt)
+
+    async def convert(self, input_path: str, output_path: str, fmt: str = None, shift_ms: int = 0):
+        """Convert without blocking the event loop; returns True on success"""
+        try:
+            await asyncio.to_thread(self.convert_file, input_path, output_path, fmt, shift_ms)
+            return True
+        except Exception as e:
+            logger.error(f"Error converting subtitle: {e}")
+            return False
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+import logging
+from pyrogram import raw
+from pyrogram.file_id import FileId
+from pyrogram.session import Session
+from pyrogram.session.auth import Auth
+from utils.input_cache import input_cache
+from utils.job_registry import job_registry
+from utils.async_files import remove
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class TransferHelper:
+    """Downloads through the input cache: parallel chunks for large files, one stream otherwise"""
+
+    # upload.GetFile accepts at most 1MB per request, at 1MB aligned offsets
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self.download_dir = getattr(Config, "DOWNLOAD_DIR", "downloads")
+        self.parallel_threshold = getattr(Config, "PARALLEL_DOWNLOAD_THRESHOLD", 20 * 1024 * 1024)
+        self.window = getattr(Config, "DOWNLOAD_WINDOW", 8)
+
+    async def download_file(self, app, message, status_msg=None):
+        """Get media through the shared input cache; pair with release()"""
+        media = message.video or message.document or message.audio
+        with job_registry.stage("download"):
+            path = await input_cache.acquire(
+                media, lambda on_progress: self._download(app, message, media, on_progress), status_msg
+            )
+        if not path:
+            job_registry.fail()
+        return path
+
+    def release(self, *paths):
+        """Give back inputs returned by download_file"""
+        input_cache.release(*paths)
+
+    async def _download(self, app, message, media, on_progress):
+        """Download media, fetching large files in parallel chunks; on_progress(current, total) is called as bytes arrive"""
+        if not media or not media.file_size or media.file_size < self.parallel_threshold:
+            return await self._single_download(app, message, media, on_progress)
+
+        try:
+            return await self._parallel_download(app, message, media, on_progress)
+        except Exception as e:
+            logger.error(f"Parallel download failed, falling back to single stream: {e}")
+            return await self._single_download(app, message, media, on_progress)
+
+    async def _single_download(self, app, message, media, on_progress):
+        """One-stream download with pyrogram, reporting progress like the parallel engine"""
+        os.makedirs(self.download_dir, exist_ok=True)
+        try:
+            return await app.download_media(
+                message,
+                file_name=os.path.abspath(self._file_path(message, media)),
+                progress=self._progress,
+                progress_args=(on_progress,)
+            )
+        except Exception as e:
+            logger.error(f"Download failed: {e}")
+            return None
+
+    @staticmethod
+    async def _progress(current, total, on_progress):
+        on_progress(current, total)
+
+    def _file_path(self, message, media):
+        file_name = os.path.basename(getattr(media, "file_name", None) or f"{getattr(media, 'file_unique_id', message.id)}.mp4")
+        return os.path.join(self.download_dir, f"{message.from_user.id}_{message.id}_{file_name}")
+
+    async def _parallel_download(self, app, message, media, on_progress):
+        """Fetch all chunks with a bounded window of in-flight GetFile requests"""
+        file_id = FileId.decode(media.file_id)
+        location = raw.types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+        session = await self._get_session(app, file_id.dc_id)
+
+        file_size = media.file_size
+        os.makedirs(self.download_dir, exist_ok=True)
+        file_path = self._file_path(message, media)
+        file_name = os.path.basename(file_path)
+        temp_path = file_path + ".temp"
+
+        total_chunks = (file_size + self.CHUNK_SIZE - 1) // self.CHUNK_SIZE
+        next_chunk = 0
+        done = 0
+        start_time = time.time()
+
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # Preallocate so every chunk can be written at its final offset
+            if hasattr(os, "posix_fallocate"):
+                await asyncio.to_thread(os.posix_fallocate, fd, 0, file_size)
+            else:
+                await asyncio.to_thread(os.ftruncate, fd, file_size)
+
+            async def worker():
+                nonlocal next_chunk, done
+                while next_chunk < total_chunks:
+                    index = next_chunk
+                    next_chunk += 1
+                    offset = index * self.CHUNK_SIZE
+
+                    r = await session.invoke(
+                        raw.functions.upload.GetFile(
+                            location=location,
+                            offset=offset,
+                            limit=self.CHUNK_SIZE
+                        ),
+                        sleep_threshold=30
+                    )
+                    if not isinstance(r, raw.types.upload.File):
+                        raise RuntimeError("CDN redirect is not supported for parallel downloads")
+
+                    await asyncio.to_thread(os.pwrite, fd, r.bytes, offset)
+                    done += len(r.bytes)
+                    on_progress(done, file_size)
+
+            workers = [asyncio.create_task(worker()) for _ in range(min(self.window, total_chunks))]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for task in workers:
+                    task.cancel()
+                raise
+        except BaseException:
+            os.close(fd)
+            await remove(temp_path)
+            raise
+
+        os.close(fd)
+        os.replace(temp_path, file_path)
+        logger.info(f"Downloaded {file_name} in {time.time() - start_time:.1f}s using {self.window} parallel requests")
+        return file_path
+
+    async def _get_session(self, app, dc_id: int):
+        """Get or create a media session for the DC holding the file"""
+        async with app.media_sessions_lock:
+            session = app.media_sessions.get(dc_id)
+            if session:
+                return session
+
+            home_dc = await app.storage.dc_id()
+            test_mode = await app.storage.test_mode()
+
+            session = Session(
+                app, dc_id,
+                await Auth(app, dc_id, test_mode).create()
+                if dc_id != home_dc
+                else await app.storage.auth_key(),
+                test_mode,
+                is_media=True
+            )
+            await session.start()
+
+            if dc_id != home_dc:
+                exported_auth = await app.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+                await session.invoke(
+                    raw.functions.auth.ImportAuthorization(
+                        id=exported_auth.id,
+                        bytes=exported_auth.bytes
+                    )
+                )
+
+            app.media_sessions[dc_id] = session
+            return session
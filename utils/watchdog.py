@@ -0,0 +1,62 @@
+import asyncio
+import time
+import logging
+from utils.job_registry import job_registry
+from utils.metrics import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Watchdog:
+    """Cancels jobs that stop making progress or run far longer than their input size allows"""
+
+    def __init__(self):
+        self.interval = getattr(Config, "WATCHDOG_INTERVAL", 5)
+        # No heartbeat (transferred bytes, ffmpeg out_time) for this long means stuck
+        self.stall_timeout = getattr(Config, "JOB_STALL_TIMEOUT", 180)
+        self.base_duration = getattr(Config, "JOB_MAX_DURATION_BASE", 600)
+        self.seconds_per_gb = getattr(Config, "JOB_MAX_SECONDS_PER_GB", 900)
+        self.task = None
+
+    def max_duration(self, input_size: int):
+        """Longest a job on input_size bytes may run once it holds a slot"""
+        return self.base_duration + self.seconds_per_gb * input_size / 1024 ** 3
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {e}")
+
+    def check(self):
+        now = time.monotonic()
+        for job in job_registry.all_jobs():
+            # Still queued for a slot
+            if job.cancelled or job.started is None:
+                continue
+
+            if now - job.last_beat > self.stall_timeout:
+                logger.warning(
+                    f"Killing job of user {job.user_id}: no progress for {int(now - job.last_beat)}s"
+                )
+                metrics.incr("watchdog_stalled")
+                job_registry.cancel_job(
+                    job, f"❌ Stopped: no progress for {int(now - job.last_beat)}s.\nPlease try again.", "stalled"
+                )
+            elif job.max_duration and now - job.started > job.max_duration:
+                logger.warning(
+                    f"Killing job of user {job.user_id}: running for {int(now - job.started)}s"
+                )
+                metrics.incr("watchdog_timeout")
+                job_registry.cancel_job(
+                    job, f"❌ Stopped: took longer than {int(job.max_duration // 60)} min.\nPlease try again.", "timeout"
+                )
+
+
+watchdog = Watchdog()